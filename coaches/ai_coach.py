@@ -1,46 +1,189 @@
 import openai
 import json
-from typing import List, Dict, Optional
+import queue
+from collections import deque
+from typing import List, Dict, Optional, Generator
 from datetime import datetime
 import time
+import threading
+import numpy as np
+
+class SemanticCache:
+    """
+    Caches coach responses keyed by question embedding so paraphrased
+    questions skip both the knowledge base search and the LLM call
+    """
+
+    def __init__(self, similarity_threshold: float = 0.92, ttl: int = 3600, max_entries: int = 500):
+        self.similarity_threshold = similarity_threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = []  # (normalized embedding, response, timestamp), oldest first
+        self._lock = threading.Lock()
+
+    def lookup(self, embedding: np.ndarray) -> Optional[Dict]:
+        """Return the cached response for the most similar question, if close enough"""
+        with self._lock:
+            # Drop expired entries (they are in insertion order)
+            cutoff = time.time() - self.ttl
+            while self._entries and self._entries[0][2] < cutoff:
+                self._entries.pop(0)
+
+            # Embeddings from the fallback model have a different dimension
+            candidates = [entry for entry in self._entries if entry[0].shape == embedding.shape]
+            if not candidates:
+                return None
+
+            # Vectors are unit-length, so one matrix-vector product gives cosine similarities
+            similarities = np.vstack([entry[0] for entry in candidates]) @ embedding
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.similarity_threshold:
+                return None
+
+            response = dict(candidates[best][1])
+
+        response["cache_hit"] = True
+        return response
+
+    def store(self, embedding: np.ndarray, response: Dict):
+        """Store a response, evicting the oldest entries past max_entries"""
+        with self._lock:
+            self._entries.append((embedding, response, time.time()))
+            if len(self._entries) > self.max_entries:
+                del self._entries[:len(self._entries) - self.max_entries]
+
+class ChatHistoryWriter:
+    """
+    Persists chat messages to the database from a background thread
+    so answering a question never waits on a write
+    """
+
+    def __init__(self, database_manager):
+        self.db = database_manager
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="chat-history-writer", daemon=True)
+        self._worker.start()
+
+    def write(self, session_id: int, message_type: str, content: str, referenced_chunks: Optional[List[Dict]] = None):
+        """Queue a message for persistence"""
+        references = json.dumps(referenced_chunks, default=str) if referenced_chunks is not None else None
+        self._queue.put((session_id, message_type, content, references))
+
+    def _run(self):
+        """Write queued messages, batching whatever has accumulated since the last write"""
+        while True:
+            messages = [self._queue.get()]
+            while True:
+                try:
+                    messages.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                self.db.add_chat_messages_bulk(messages)
+            except Exception as e:
+                print(f"Error saving {len(messages)} chat messages: {e}")
 
 class AICoach:
     """
     AI Coach that gives authentic advice based on creator's actual content and expertise
     """
 
-    def __init__(self, openai_api_key: str, creator_id: int, coach_profile: Dict, rag_system, database_manager=None):
-        self.openai_client = openai.OpenAI(api_key=openai_api_key)
+    def __init__(self, openai_api_key: str, creator_id: int, coach_profile: Dict, rag_system, database_manager=None,
+                 semantic_cache: Optional[SemanticCache] = None, openai_client: Optional[openai.OpenAI] = None,
+                 history_writer: Optional[ChatHistoryWriter] = None, max_history: int = 50):
+        # Coaches loaded by CoachManager share one client and its connection pool
+        self.openai_client = openai_client or openai.OpenAI(api_key=openai_api_key)
         self.creator_id = creator_id
         self.coach_profile = coach_profile
         self.rag_system = rag_system
         self.db = database_manager
+        self.semantic_cache = semantic_cache
         self.system_prompt = coach_profile.get("system_prompt", "")
-        self.conversation_history = []
+
+        # Only recent turns stay in memory; the full history is persisted to chat_messages
+        self.conversation_history = deque(maxlen=max_history)
+        self.history_writer = history_writer
+        self.session_id = None
+
+        # Static prompt prefix, built once so it is byte-identical on every call
+        self.static_prompt = self._build_static_prompt()
+
+        # Prompt cache statistics
+        self.prompt_tokens_total = 0
+        self.cached_tokens_total = 0
 
     def ask_coach(self, question: str, context_chunks: int = 5) -> Dict:
         """
         Ask the coach a question and get an authentic response based on their content
         """
+        # Drain the stream; the generator returns the complete response
+        stream = self.ask_coach_stream(question, context_chunks)
+        while True:
+            try:
+                next(stream)
+            except StopIteration as finished:
+                return finished.value
+
+    def ask_coach_stream(self, question: str, context_chunks: int = 5) -> Generator[str, None, Dict]:
+        """
+        Ask the coach a question, yielding the answer text as it is generated.
+        The generator's return value is the complete response dict.
+        """
         print(f"Processing question for coach {self.coach_profile['creator_username']}...")
 
-        # Step 1: Search knowledge base for relevant content
-        relevant_chunks = self.rag_system.search_knowledge(question, k=context_chunks)
-
-        # Step 2: Build context from relevant chunks
-        context = self._build_context_from_chunks(relevant_chunks)
+        # Step 1: Embed the question once and check for a near-identical earlier question
+        question_embedding = self.rag_system.embed_query(question)
+        response = self.semantic_cache.lookup(question_embedding[0]) if self.semantic_cache else None
 
-        # Step 3: Generate response using coach's authentic persona
-        response = self._generate_coach_response(question, context, relevant_chunks)
+        if response is None:
+            response = yield from self._answer_question(question, question_embedding, context_chunks)
+        else:
+            yield response["answer"]
 
-        # Step 4: Store conversation
+        # Store conversation
         conversation_entry = {
             "question": question,
             "response": response["answer"],
             "referenced_content": response["references"],
-            "timestamp": datetime.now().isoformat()
+            "timestamp": time.time()
         }
         self.conversation_history.append(conversation_entry)
+        self._persist_exchange(question, response)
+
+        return response
+
+    def _persist_exchange(self, question: str, response: Dict):
+        """Queue a question and its answer for the chat_messages table"""
+        if not self.history_writer:
+            return
+
+        try:
+            if self.session_id is None:
+                self.session_id = self.db.create_chat_session(self.creator_id)
+        except Exception as e:
+            print(f"Error creating chat session for creator {self.creator_id}: {e}")
+            return
+
+        self.history_writer.write(self.session_id, "user", question)
+        self.history_writer.write(self.session_id, "coach", response["answer"], response["references"])
+
+    def _answer_question(self, question: str, question_embedding: np.ndarray, context_chunks: int) -> Generator[str, None, Dict]:
+        """Run the knowledge base search and LLM call for a question"""
+        # Step 1: Search knowledge base for relevant content
+        relevant_chunks = self.rag_system.search_knowledge(
+            question, k=context_chunks, query_embedding=question_embedding
+        )
+
+        # Step 2: Build context from relevant chunks
+        context = self._build_context_from_chunks(relevant_chunks)
+
+        # Step 3: Generate response using coach's authentic persona
+        response = yield from self._generate_coach_response(question, context, relevant_chunks)
+
+        # Only cache successful answers
+        if self.semantic_cache and "error" not in response:
+            self.semantic_cache.store(question_embedding[0], response)
 
         return response
 
@@ -52,45 +195,35 @@ class AICoach:
         context_parts = []
 
         for i, chunk in enumerate(chunks, 1):
-            chunk_context = f"\n--- RELEVANT CONTENT {i} ---\n"
-            chunk_context += f"From: {chunk.get('chunk_type', 'content')} "
-
             # Add post metadata if available
             post_meta = chunk.get('post_metadata', {})
+            post_suffix = ""
             if post_meta.get('post_id'):
-                chunk_context += f"(Post {post_meta['post_id']}"
-                if post_meta.get('likes'):
-                    chunk_context += f", {post_meta['likes']} likes"
-                chunk_context += ")"
-
-            chunk_context += f"\nContent: {chunk['chunk_text']}\n"
-
-            # Add framework reference if available
-            if chunk.get('framework_reference'):
-                chunk_context += f"Framework: {chunk['framework_reference']}\n"
-
-            # Add expertise area
-            if chunk.get('expertise_area'):
-                chunk_context += f"Topic: {chunk['expertise_area']}\n"
-
-            context_parts.append(chunk_context)
+                likes = f", {post_meta['likes']} likes" if post_meta.get('likes') else ""
+                post_suffix = f"(Post {post_meta['post_id']}{likes})"
+
+            # Add framework reference and expertise area if available
+            framework_line = f"Framework: {chunk['framework_reference']}\n" if chunk.get('framework_reference') else ""
+            topic_line = f"Topic: {chunk['expertise_area']}\n" if chunk.get('expertise_area') else ""
+
+            context_parts.append(
+                f"\n--- RELEVANT CONTENT {i} ---\n"
+                f"From: {chunk.get('chunk_type', 'content')} {post_suffix}\n"
+                f"Content: {chunk['chunk_text']}\n"
+                f"{framework_line}{topic_line}"
+            )
 
         return "\n".join(context_parts)
 
-    def _generate_coach_response(self, question: str, context: str, referenced_chunks: List[Dict]) -> Dict:
-        """Generate authentic coach response using system prompt and relevant context"""
-
-        # Get creator username for responses
+    def _build_static_prompt(self) -> str:
+        """Build the per-coach system prompt that stays byte-identical across calls"""
         creator_username = self.coach_profile.get('creator_username', f'creator_{self.creator_id}')
 
-        # Build the prompt with context
-        user_prompt = f"""
-Based on my actual content and expertise, please answer this question:
+        # Everything here is fixed for the lifetime of the coach, so it forms a
+        # stable prefix that the API's automatic prompt caching can reuse
+        return f"""{self.system_prompt}
 
-QUESTION: {question}
-
-RELEVANT CONTENT FROM MY POSTS:
-{context}
+You are {creator_username}. Answer questions based on your actual content and expertise.
 
 Remember to:
 1. Answer as me ({creator_username}), in first person
@@ -102,22 +235,62 @@ Remember to:
 Please provide a comprehensive, helpful answer based on my real content and proven methods.
 """
 
+    def _record_cache_usage(self, usage):
+        """Track prompt-cache hits reported by the API"""
+        if not usage:
+            return
+
+        details = getattr(usage, 'prompt_tokens_details', None)
+        cached_tokens = getattr(details, 'cached_tokens', 0) or 0
+
+        self.prompt_tokens_total += usage.prompt_tokens or 0
+        self.cached_tokens_total += cached_tokens
+
+        if self.prompt_tokens_total:
+            hit_rate = self.cached_tokens_total / self.prompt_tokens_total
+            print(f"Prompt cache: {cached_tokens}/{usage.prompt_tokens} tokens cached "
+                  f"(overall hit rate {hit_rate:.1%})")
+
+    def _generate_coach_response(self, question: str, context: str, referenced_chunks: List[Dict]) -> Generator[str, None, Dict]:
+        """Stream authentic coach response using system prompt and relevant context"""
+
+        # Get creator username for responses
+        creator_username = self.coach_profile.get('creator_username', f'creator_{self.creator_id}')
+
+        # Order messages from most to least static so repeated calls share the
+        # longest possible prefix: instructions, then retrieved content, then the question
+        messages = [
+            {"role": "system", "content": self.static_prompt},
+            {"role": "user", "content": f"RELEVANT CONTENT FROM MY POSTS:\n{context}"},
+            {"role": "user", "content": f"QUESTION: {question}"}
+        ]
+
         try:
-            response = self.openai_client.chat.completions.create(
+            stream = self.openai_client.chat.completions.create(
                 model="gpt-4",
-                messages=[
-                    {"role": "system", "content": self.system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
+                messages=messages,
                 temperature=0.7,
-                max_tokens=800
+                max_tokens=800,
+                stream=True,
+                stream_options={"include_usage": True}
             )
 
-            answer = response.choices[0].message.content
-
-            # Extract referenced content for transparency
+            # Extract referenced content for transparency while the model starts generating
             references = self._extract_references(referenced_chunks)
 
+            answer_parts = []
+            for event in stream:
+                # The final event carries no choices, only token usage
+                if event.usage:
+                    self._record_cache_usage(event.usage)
+
+                if event.choices and event.choices[0].delta.content:
+                    delta = event.choices[0].delta.content
+                    answer_parts.append(delta)
+                    yield delta
+
+            answer = "".join(answer_parts)
+
             return {
                 "answer": answer,
                 "references": references,
@@ -128,8 +301,11 @@ Please provide a comprehensive, helpful answer based on my real content and prov
 
         except Exception as e:
             print(f"Error generating coach response: {e}")
+            # Don't stream the apology after a partial answer: the response below
+            # replaces whatever was already sent, so the truncated text is discarded
+            answer = "I'm sorry, I'm having trouble accessing my knowledge right now. Please try again."
             return {
-                "answer": f"I'm sorry, I'm having trouble accessing my knowledge right now. Please try again.",
+                "answer": answer,
                 "references": [],
                 "context_used": 0,
                 "coach_name": creator_username,
@@ -171,21 +347,12 @@ Please provide a comprehensive, helpful answer based on my real content and prov
         if self.db:
             stats = self.db.get_creator_post_stats(self.creator_id)
 
-            # Get high engagement count with efficient query
-            conn = self.db.db_path
-            import sqlite3
-            db_conn = sqlite3.connect(conn)
-            cursor = db_conn.cursor()
-            cursor.execute('SELECT COUNT(*) FROM posts WHERE creator_id = ? AND likes > 1000', (self.creator_id,))
-            high_engagement_count = cursor.fetchone()[0]
-            db_conn.close()
-
             return {
                 "name": creator_username,
                 "total_posts": stats['total_posts'],
                 "video_posts": stats['video_posts'],
                 "transcribed_posts": stats['transcribed_posts'],
-                "high_engagement_posts": high_engagement_count,
+                "high_engagement_posts": stats['high_engagement_posts'],
                 "platform": self.coach_profile.get('platform', 'instagram'),
                 "description": f"I'm {creator_username}, and I can help you based on insights from my {stats['total_posts']} posts, including {stats['transcribed_posts']} transcribed videos. Ask me anything about my content and experiences!",
                 "knowledge_base_size": len(self.rag_system.chunk_metadata) if hasattr(self.rag_system, 'chunk_metadata') else 0,
@@ -204,30 +371,57 @@ Please provide a comprehensive, helpful answer based on my real content and prov
 
     def get_conversation_history(self) -> List[Dict]:
         """Get conversation history for this session"""
-        return self.conversation_history
+        # Timestamps are stored as epoch floats and only formatted when read
+        return [
+            {**entry, "timestamp": datetime.fromtimestamp(entry["timestamp"]).isoformat()}
+            for entry in self.conversation_history
+        ]
 
     def clear_conversation_history(self):
         """Clear conversation history"""
-        self.conversation_history = []
+        self.conversation_history.clear()
 
 class CoachManager:
     """
     Manages multiple AI coaches and handles coach selection/creation
     """
 
-    def __init__(self, openai_api_key: str, database_manager, rag_system):
+    def __init__(self, openai_api_key: str, database_manager, rag_system,
+                 similarity_threshold: float = 0.92, ttl: int = 3600, max_entries: int = 500):
         self.openai_api_key = openai_api_key
+        self.openai_client = openai.OpenAI(api_key=openai_api_key)
         self.db = database_manager
-        self.rag_system = rag_system
+        self._rag_system = rag_system  # a RAGKnowledgeBase, or a callable that builds one on first use
         self.active_coaches = {}  # creator_id -> AICoach instance
+        self._last_used = {}  # creator_id -> time the coach was last requested
+        self.coach_idle_ttl = 1800  # 30 minutes
+
+        # Chat messages are persisted in the background, shared by all coaches
+        self.history_writer = ChatHistoryWriter(database_manager)
+
+        # Semantic response caches, one per creator
+        self.similarity_threshold = similarity_threshold
+        self.semantic_cache_ttl = ttl
+        self.semantic_cache_max_entries = max_entries
+        self.semantic_caches = {}  # creator_id -> SemanticCache
 
         # Simple in-memory cache with TTL
         self._cache = {}
         self._cache_ttl = 300  # 5 minutes
 
+    @property
+    def rag_system(self):
+        """Knowledge base shared by all coaches, resolved on first use"""
+        if callable(self._rag_system):
+            self._rag_system = self._rag_system()
+        return self._rag_system
+
     def load_coach(self, creator_id: int) -> Optional[AICoach]:
         """Load or create coach for a creator"""
+        self._evict_idle(self.coach_idle_ttl)
+
         if creator_id in self.active_coaches:
+            self._last_used[creator_id] = time.time()
             return self.active_coaches[creator_id]
 
         # Get coach profile from database
@@ -236,24 +430,52 @@ class CoachManager:
             print(f"No coach profile found for creator {creator_id}")
             return None
 
-        # Load knowledge base
-        if not self.rag_system.load_knowledge_base(creator_id):
+        # Load knowledge base into the coach's own instance so other creators' loads and
+        # rebuilds can't swap its index out from under it
+        rag_system = self.rag_system.clone()
+        if not rag_system.load_knowledge_base(creator_id):
             print(f"No knowledge base found for creator {creator_id}")
             return None
 
+        # One semantic cache per loaded coach; it is dropped when the coach is evicted
+        if creator_id not in self.semantic_caches:
+            self.semantic_caches[creator_id] = SemanticCache(
+                self.similarity_threshold,
+                self.semantic_cache_ttl,
+                self.semantic_cache_max_entries
+            )
+
         # Create coach instance
         coach = AICoach(
             self.openai_api_key,
             creator_id,
             coach_profile,
-            self.rag_system,
-            self.db
+            rag_system,
+            self.db,
+            self.semantic_caches[creator_id],
+            self.openai_client,
+            self.history_writer
         )
 
         self.active_coaches[creator_id] = coach
+        self._last_used[creator_id] = time.time()
         print(f"✓ Coach loaded for creator {creator_id}")
         return coach
 
+    def unload_coach(self, creator_id: int):
+        """Drop a loaded coach so the next request picks up a rebuilt knowledge base"""
+        self.active_coaches.pop(creator_id, None)
+        self._last_used.pop(creator_id, None)
+        self.semantic_caches.pop(creator_id, None)  # cached answers came from the old knowledge base
+
+    def _evict_idle(self, ttl: int = 1800):
+        """Drop coaches that have not been used for ttl seconds"""
+        cutoff = time.time() - ttl
+        for creator_id, last_used in list(self._last_used.items()):
+            if last_used < cutoff:
+                self.unload_coach(creator_id)  # its semantic cache goes with it
+                print(f"Unloaded idle coach for creator {creator_id}")
+
     def _get_cache_key(self, key: str) -> str:
         """Generate cache key"""
         return f"coach_cache_{key}"
@@ -289,26 +511,21 @@ class CoachManager:
         if cached_result is not None:
             return cached_result
 
-        creators = self.db.get_creators()
         available_coaches = []
 
-        for creator in creators:
-            coach_profile = self.db.get_coach_profile(creator['id'])
-            if coach_profile:
-                # Get dynamic stats efficiently with single SQL query
-                stats = self.db.get_creator_post_stats(creator['id'])
-
-                available_coaches.append({
-                    "creator_id": creator['id'],
-                    "username": creator['username'],
-                    "display_name": creator.get('display_name', creator['username']),
-                    "total_posts": stats['total_posts'],
-                    "transcribed_posts": stats['transcribed_posts'],
-                    "knowledge_transcriptions": stats['knowledge_transcriptions'],
-                    "knowledge_chunks": stats['knowledge_chunks'],
-                    "platform": creator.get('platform', 'instagram'),
-                    "last_updated": coach_profile.get('updated_at')
-                })
+        # One grouped query instead of a profile and stats lookup per creator
+        for coach in self.db.get_all_coaches_with_stats():
+            available_coaches.append({
+                "creator_id": coach['id'],
+                "username": coach['username'],
+                "display_name": coach['display_name'],
+                "total_posts": coach['total_posts'],
+                "transcribed_posts": coach['transcribed_posts'],
+                "knowledge_transcriptions": coach['knowledge_transcriptions'],
+                "knowledge_chunks": coach['knowledge_chunks'],
+                "platform": coach['platform'] or 'instagram',
+                "last_updated": coach['updated_at']
+            })
 
         # Cache the result
         self._set_cache('available_coaches', available_coaches)
@@ -325,20 +542,22 @@ class CoachManager:
 
         return coach.ask_coach(question)
 
+    def ask_coach_stream_by_id(self, creator_id: int, question: str) -> Optional[Generator[str, None, Dict]]:
+        """Stream a specific coach's answer; returns None if the coach is not available"""
+        coach = self.load_coach(creator_id)
+        if not coach:
+            return None
+
+        return coach.ask_coach_stream(question)
+
     def ask_coach_by_username(self, username: str, question: str) -> Dict:
         """Ask a coach by username"""
-        creators = self.db.get_creators()
-        creator_id = None
-
-        for creator in creators:
-            if creator['username'].lower() == username.lower():
-                creator_id = creator['id']
-                break
+        creator = self.db.get_creator_by_username(username)
 
-        if not creator_id:
+        if not creator:
             return {
                 "error": f"No coach found for @{username}",
                 "available_coaches": self.get_available_coaches()
             }
 
-        return self.ask_coach_by_id(creator_id, question)
\ No newline at end of file
+        return self.ask_coach_by_id(creator['id'], question)
\ No newline at end of file
@@ -1,28 +1,113 @@
 import sqlite3
 import json
-from datetime import datetime
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 import threading
+import time
+from contextlib import contextmanager
+import numpy as np
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+_json_loads = orjson.loads if ORJSON_AVAILABLE else json.loads
+
+def _loads_json_list(value) -> List:
+    """Parse a JSON list column, skipping the parser for empty values"""
+    if not value or value == '[]':
+        return []
+    return _json_loads(value)
+
+_POST_COLUMNS = '''
+    creator_id, post_id, post_type, caption_text, transcript,
+    media_url, post_date, likes, comments, shares, views,
+    engagement_rate, hashtags, mentions, duration
+'''
+
+_INSERT_POST_SQL = f'''
+    INSERT INTO posts ({_POST_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+# Bulk ingestion skips posts that were already scraped instead of aborting the batch
+_INSERT_POST_IGNORE_SQL = f'''
+    INSERT OR IGNORE INTO posts ({_POST_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+# Storage formats for knowledge chunk embeddings
+EMBEDDING_DTYPES = ('float32', 'float16', 'int8')
+
+_INSERT_CHUNK_SQL = '''
+    INSERT INTO knowledge_chunks (
+        creator_id, post_id, chunk_text, chunk_type, topic_tags,
+        embedding_vector, embedding_dtype, embedding_scale
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
 
 class DatabaseManager:
-    def __init__(self, db_path: str = "database/creator_coaches.db"):
+    def __init__(self, db_path: str = "database/creator_coaches.db", embedding_dtype: str = "int8"):
+        if embedding_dtype not in EMBEDDING_DTYPES:
+            raise ValueError(f"embedding_dtype must be one of {EMBEDDING_DTYPES}")
+
         self.db_path = db_path
+        self.embedding_dtype = embedding_dtype  # Storage format for new chunk embeddings
         self._local = threading.local()  # Thread-local storage for connections
+
+        # Coach profiles change rarely, so cache decoded profiles briefly
+        self._profile_cache: Dict[int, Tuple[float, Dict]] = {}  # creator_id -> (timestamp, profile)
+        self._profile_cache_ttl = 60  # seconds
         self.init_database()
 
     def get_connection(self):
         """Get thread-safe database connection"""
         if not hasattr(self._local, 'connection') or self._local.connection is None:
-            self._local.connection = sqlite3.connect(self.db_path, check_same_thread=False)
-            # Enable WAL mode for better concurrency
-            self._local.connection.execute('PRAGMA journal_mode=WAL')
+            # Autocommit mode; writes are grouped explicitly with transaction()
+            self._local.connection = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            self._local.configured = False
+
+        if not self._local.configured:
+            conn = self._local.connection
+            # WAL keeps the database consistent without an fsync on every commit
+            conn.execute('PRAGMA synchronous=NORMAL')
+            # 64 MB page cache, in-memory temp tables and 256 MB of memory-mapped I/O
+            conn.execute('PRAGMA cache_size=-65536')
+            conn.execute('PRAGMA temp_store=MEMORY')
+            conn.execute('PRAGMA mmap_size=268435456')
+            # Wait for competing writers instead of failing with "database is locked"
+            conn.execute('PRAGMA busy_timeout=5000')
+            # Rows support both index and column-name access
+            conn.row_factory = sqlite3.Row
+            self._local.configured = True
+
         return self._local.connection
 
+    @contextmanager
+    def transaction(self):
+        """Run writes in one BEGIN IMMEDIATE/COMMIT; nested calls join the outer transaction"""
+        conn = self.get_connection()
+
+        if conn.in_transaction:
+            yield conn
+            return
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
     def init_database(self):
         """Initialize database with all required tables"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.get_connection()
         cursor = conn.cursor()
 
+        # Enable WAL mode for better concurrency; it's stored in the database file,
+        # so once here covers every connection opened afterwards
+        cursor.execute('PRAGMA journal_mode=WAL')
+
         # Creators table
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS creators (
@@ -88,13 +173,22 @@ class DatabaseManager:
                 chunk_text TEXT,
                 chunk_type TEXT,
                 topic_tags TEXT,
-                embedding_vector BLOB,
+                embedding_vector BLOB,  -- contiguous bytes in embedding_dtype layout
+                embedding_dtype TEXT DEFAULT 'float32',
+                embedding_scale REAL,  -- per-vector dequantization scale for int8
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 FOREIGN KEY (creator_id) REFERENCES creators (id),
                 FOREIGN KEY (post_id) REFERENCES posts (id)
             )
         ''')
 
+        # Databases created before embedding quantization lack these columns
+        chunk_columns = {row[1] for row in cursor.execute('PRAGMA table_info(knowledge_chunks)')}
+        if 'embedding_dtype' not in chunk_columns:
+            cursor.execute("ALTER TABLE knowledge_chunks ADD COLUMN embedding_dtype TEXT DEFAULT 'float32'")
+        if 'embedding_scale' not in chunk_columns:
+            cursor.execute('ALTER TABLE knowledge_chunks ADD COLUMN embedding_scale REAL')
+
         # Chat sessions for tracking conversations
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS chat_sessions (
@@ -119,43 +213,75 @@ class DatabaseManager:
             )
         ''')
 
+        # Background jobs started from the web UI, shared across server processes
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                job_type TEXT NOT NULL,
+                creator_id INTEGER,
+                status TEXT NOT NULL DEFAULT 'queued',
+                result TEXT,
+                error TEXT,
+                worker_pid INTEGER,  -- server process running the job
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (creator_id) REFERENCES creators (id)
+            )
+        ''')
+
+        # Job tables created before interrupted-job detection lack the owner column
+        job_columns = {row[1] for row in cursor.execute('PRAGMA table_info(jobs)')}
+        if 'worker_pid' not in job_columns:
+            cursor.execute('ALTER TABLE jobs ADD COLUMN worker_pid INTEGER')
+
         # Add indexes for better performance
+        existing_indexes = {row[0] for row in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_posts_creator_id ON posts (creator_id)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_posts_transcript ON posts (creator_id, transcript)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_posts_type ON posts (creator_id, post_type)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_posts_likes ON posts (creator_id, likes)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_coach_profiles_creator ON coach_profiles (creator_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_creators_username_lower ON creators (lower(username))')
 
-        conn.commit()
-        conn.close()
+        # Covering indexes so the per-creator stats aggregates never touch table rows.
+        # They supersede the narrower (creator_id, transcript) and (creator_id, post_type) indexes.
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_posts_creator_covering ON posts (creator_id, post_type, likes, transcript)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_knowledge_creator_post ON knowledge_chunks (creator_id, post_id)')
+        cursor.execute('DROP INDEX IF EXISTS idx_posts_transcript')
+        cursor.execute('DROP INDEX IF EXISTS idx_posts_type')
+
+        # Refresh planner statistics once, when the covering indexes are first built
+        if not {'idx_posts_creator_covering', 'idx_knowledge_creator_post'} <= existing_indexes:
+            cursor.execute('ANALYZE')
 
     def add_creator(self, username: str, platform: str, display_name: str = None, bio: str = None) -> int:
         """Add a new creator to track"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        cursor.execute('''
-            INSERT INTO creators (username, platform, display_name, bio)
-            VALUES (?, ?, ?, ?)
-        ''', (username, platform, display_name, bio))
+        with self.transaction() as conn:
+            cursor = conn.execute('''
+                INSERT INTO creators (username, platform, display_name, bio)
+                VALUES (?, ?, ?, ?)
+            ''', (username, platform, display_name, bio))
 
-        creator_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        return creator_id
+        return cursor.lastrowid
 
     def add_post(self, creator_id: int, post_data: Dict) -> int:
         """Add a post with all metrics"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        with self.transaction() as conn:
+            cursor = conn.execute(_INSERT_POST_SQL, self._post_row(creator_id, post_data))
 
-        cursor.execute('''
-            INSERT INTO posts (
-                creator_id, post_id, post_type, caption_text, transcript,
-                media_url, post_date, likes, comments, shares, views,
-                engagement_rate, hashtags, mentions, duration
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
+        return cursor.lastrowid
+
+    def add_posts_bulk(self, creator_id: int, posts: List[Dict]) -> int:
+        """Add many posts in one transaction, skipping ones already stored; returns the number inserted"""
+        with self.transaction() as conn:
+            changes_before = conn.total_changes
+            conn.executemany(_INSERT_POST_IGNORE_SQL, [self._post_row(creator_id, post) for post in posts])
+            inserted = conn.total_changes - changes_before
+
+        return inserted
+
+    def _post_row(self, creator_id: int, post_data: Dict) -> tuple:
+        """Build the parameter tuple for a posts INSERT"""
+        return (
             creator_id,
             post_data.get('post_id'),
             post_data.get('post_type'),
@@ -171,119 +297,182 @@ class DatabaseManager:
             json.dumps(post_data.get('hashtags', [])),
             json.dumps(post_data.get('mentions', [])),
             post_data.get('duration', 0)
-        ))
-
-        post_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        return post_id
+        )
 
     def get_creator_posts(self, creator_id: int) -> List[Dict]:
         """Get all posts for a creator"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        conn = self.get_connection()
 
-        cursor.execute('''
+        cursor = conn.execute('''
             SELECT * FROM posts WHERE creator_id = ? ORDER BY post_date DESC
         ''', (creator_id,))
 
         posts = []
         for row in cursor.fetchall():
-            post = dict(zip([col[0] for col in cursor.description], row))
-            post['hashtags'] = json.loads(post['hashtags'] or '[]')
-            post['mentions'] = json.loads(post['mentions'] or '[]')
+            post = dict(row)
+            post['hashtags'] = _loads_json_list(post['hashtags'])
+            post['mentions'] = _loads_json_list(post['mentions'])
             posts.append(post)
 
-        conn.close()
         return posts
 
+    def get_untranscribed_videos(self, creator_id: int, post_ids: Optional[List[str]] = None) -> List[Dict]:
+        """Get a creator's video posts that still need a transcript, optionally limited to post_ids"""
+        conn = self.get_connection()
+        ids_json = json.dumps([str(post_id) for post_id in post_ids]) if post_ids else None
+
+        # Only the columns the transcriber needs
+        cursor = conn.execute('''
+            SELECT post_id, post_type, media_url FROM posts
+            WHERE creator_id = ? AND post_type = 'video'
+              AND (transcript IS NULL OR transcript = '')
+              AND media_url IS NOT NULL AND media_url != ''
+              AND (? IS NULL OR post_id IN (SELECT value FROM json_each(?)))
+            ORDER BY post_date DESC
+        ''', (creator_id, ids_json, ids_json))
+
+        return [dict(row) for row in cursor.fetchall()]
+
     def save_coach_profile(self, creator_id: int, profile_data: Dict) -> int:
         """Save generated coach profile"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        cursor.execute('''
-            INSERT OR REPLACE INTO coach_profiles (
-                creator_id, expertise_areas, frameworks, teaching_style,
-                signature_phrases, key_results, system_prompt, updated_at
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            creator_id,
-            json.dumps(profile_data.get('expertise_areas', [])),
-            json.dumps(profile_data.get('frameworks', [])),
-            str(profile_data.get('teaching_style', '')),
-            json.dumps(profile_data.get('signature_phrases', [])),
-            json.dumps(profile_data.get('key_results', [])),
-            str(profile_data.get('system_prompt', '')),
-            datetime.now().isoformat()
-        ))
-
-        profile_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        return profile_id
+        with self.transaction() as conn:
+            cursor = conn.execute('''
+                INSERT OR REPLACE INTO coach_profiles (
+                    creator_id, expertise_areas, frameworks, teaching_style,
+                    signature_phrases, key_results, system_prompt, updated_at
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ''', (
+                creator_id,
+                json.dumps(profile_data.get('expertise_areas', [])),
+                json.dumps(profile_data.get('frameworks', [])),
+                str(profile_data.get('teaching_style', '')),
+                json.dumps(profile_data.get('signature_phrases', [])),
+                json.dumps(profile_data.get('key_results', [])),
+                str(profile_data.get('system_prompt', ''))
+            ))
+
+        self._profile_cache.pop(creator_id, None)
+        return cursor.lastrowid
 
     def get_coach_profile(self, creator_id: int) -> Optional[Dict]:
         """Get coach profile for a creator"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        cached = self._profile_cache.get(creator_id)
+        if cached and time.time() - cached[0] < self._profile_cache_ttl:
+            return dict(cached[1])
+
+        conn = self.get_connection()
 
         # Get both coach profile and creator info
-        cursor.execute('''
+        row = conn.execute('''
             SELECT cp.*, c.username
             FROM coach_profiles cp
             JOIN creators c ON cp.creator_id = c.id
             WHERE cp.creator_id = ?
-        ''', (creator_id,))
+        ''', (creator_id,)).fetchone()
 
-        row = cursor.fetchone()
         if not row:
-            conn.close()
             return None
 
-        profile = dict(zip([col[0] for col in cursor.description], row))
-        profile['expertise_areas'] = json.loads(profile['expertise_areas'] or '[]')
-        profile['frameworks'] = json.loads(profile['frameworks'] or '[]')
-        profile['signature_phrases'] = json.loads(profile['signature_phrases'] or '[]')
-        profile['key_results'] = json.loads(profile['key_results'] or '[]')
+        profile = dict(row)
+        profile['expertise_areas'] = _loads_json_list(profile['expertise_areas'])
+        profile['frameworks'] = _loads_json_list(profile['frameworks'])
+        profile['signature_phrases'] = _loads_json_list(profile['signature_phrases'])
+        profile['key_results'] = _loads_json_list(profile['key_results'])
 
         # Add creator_username for compatibility
         profile['creator_username'] = profile['username']
 
-        conn.close()
-        return profile
+        self._profile_cache[creator_id] = (time.time(), profile)
+        return dict(profile)
 
     def add_knowledge_chunk(self, creator_id: int, post_id: int, chunk_data: Dict) -> int:
         """Add a knowledge chunk for RAG"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        cursor.execute('''
-            INSERT INTO knowledge_chunks (
-                creator_id, post_id, chunk_text, chunk_type, topic_tags, embedding_vector
-            ) VALUES (?, ?, ?, ?, ?, ?)
-        ''', (
+        with self.transaction() as conn:
+            cursor = conn.execute(_INSERT_CHUNK_SQL, self._chunk_row(creator_id, post_id, chunk_data))
+
+        return cursor.lastrowid
+
+    def add_knowledge_chunks_bulk(self, creator_id: int, chunks: List[Dict], embeddings: Optional[np.ndarray] = None) -> int:
+        """
+        Add many knowledge chunks in one transaction; each chunk dict carries its database post_id.
+        Pass embeddings as an (N, D) matrix aligned with chunks to encode them all in one vectorized pass.
+        """
+        if embeddings is None:
+            rows = [self._chunk_row(creator_id, chunk['post_id'], chunk) for chunk in chunks]
+        else:
+            encoded = self._encode_embedding_matrix(embeddings)
+            rows = [
+                (creator_id, chunk['post_id'], chunk.get('chunk_text'), chunk.get('chunk_type'),
+                 json.dumps(chunk.get('topic_tags', [])), *encoded[i])
+                for i, chunk in enumerate(chunks)
+            ]
+
+        with self.transaction() as conn:
+            conn.executemany(_INSERT_CHUNK_SQL, rows)
+
+        return len(chunks)
+
+    def _chunk_row(self, creator_id: int, post_id: int, chunk_data: Dict) -> tuple:
+        """Build the parameter tuple for a knowledge_chunks INSERT"""
+        return (
             creator_id,
             post_id,
             chunk_data.get('chunk_text'),
             chunk_data.get('chunk_type'),
             json.dumps(chunk_data.get('topic_tags', [])),
-            chunk_data.get('embedding_vector')
-        ))
-
-        chunk_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        return chunk_id
+            *self._encode_embedding(chunk_data.get('embedding_vector'))
+        )
+
+    def _encode_embedding(self, vector) -> tuple:
+        """Serialize an embedding as (raw bytes, dtype, scale) in the configured storage format"""
+        if vector is None:
+            return None, None, None
+
+        vector = np.ascontiguousarray(vector, dtype=np.float32)
+
+        if self.embedding_dtype == 'float16':
+            return vector.astype(np.float16).tobytes(), 'float16', None
+
+        if self.embedding_dtype == 'int8':
+            # Symmetric per-vector quantization: v ~= q * scale with q in [-127, 127]
+            max_abs = float(np.abs(vector).max()) if vector.size else 0.0
+            scale = max_abs / 127 if max_abs > 0 else 1.0
+            quantized = np.round(vector / scale).astype(np.int8)
+            return quantized.tobytes(), 'int8', scale
+
+        return vector.tobytes(), 'float32', None
+
+    def _encode_embedding_matrix(self, matrix: np.ndarray) -> List[tuple]:
+        """Serialize every row of an (N, D) matrix at once; same per-row format as _encode_embedding"""
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        if matrix.size == 0:
+            return [(None, None, None)] * len(matrix)
+
+        if self.embedding_dtype == 'float16':
+            stored = matrix.astype(np.float16)
+            scales = [None] * len(matrix)
+        elif self.embedding_dtype == 'int8':
+            max_abs = np.abs(matrix).max(axis=1)
+            scale_column = np.where(max_abs > 0, max_abs / 127, 1.0).astype(np.float32)
+            stored = np.round(matrix / scale_column[:, None]).astype(np.int8)
+            scales = scale_column.tolist()
+        else:
+            stored = matrix
+            scales = [None] * len(matrix)
+
+        # Slice row blobs out of one contiguous buffer
+        data = stored.tobytes()
+        row_size = stored.shape[1] * stored.itemsize
+        return [
+            (data[i * row_size:(i + 1) * row_size], self.embedding_dtype, scales[i])
+            for i in range(len(stored))
+        ]
 
     def delete_creator_knowledge_chunks(self, creator_id: int) -> bool:
         """Delete all knowledge chunks for a creator"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('DELETE FROM knowledge_chunks WHERE creator_id = ?', (creator_id,))
-            conn.commit()
-            conn.close()
+            with self.transaction() as conn:
+                conn.execute('DELETE FROM knowledge_chunks WHERE creator_id = ?', (creator_id,))
             return True
         except Exception as e:
             print(f"Error deleting knowledge chunks for creator {creator_id}: {e}")
@@ -291,16 +480,42 @@ class DatabaseManager:
 
     def get_creators(self) -> List[Dict]:
         """Get all creators"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        conn = self.get_connection()
 
-        cursor.execute('SELECT * FROM creators WHERE is_active = 1')
-        creators = []
-        for row in cursor.fetchall():
-            creators.append(dict(zip([col[0] for col in cursor.description], row)))
+        cursor = conn.execute('SELECT * FROM creators WHERE is_active = 1')
+        return [dict(row) for row in cursor.fetchall()]
 
-        conn.close()
-        return creators
+    def get_creators_with_post_counts(self) -> List[Dict]:
+        """Get all creators along with how many posts each has"""
+        conn = self.get_connection()
+
+        cursor = conn.execute('''
+            SELECT c.*, COUNT(p.id) AS post_count
+            FROM creators c
+            LEFT JOIN posts p ON p.creator_id = c.id
+            WHERE c.is_active = 1
+            GROUP BY c.id
+        ''')
+        return [dict(row) for row in cursor.fetchall()]
+
+    def get_creator(self, creator_id: int) -> Optional[Dict]:
+        """Get an active creator by id"""
+        conn = self.get_connection()
+
+        row = conn.execute('SELECT * FROM creators WHERE id = ? AND is_active = 1', (creator_id,)).fetchone()
+        return dict(row) if row else None
+
+    def get_creator_by_username(self, username: str) -> Optional[Dict]:
+        """Find an active creator by username, ignoring case"""
+        conn = self.get_connection()
+
+        row = conn.execute('''
+            SELECT id, username, display_name, platform FROM creators
+            WHERE lower(username) = lower(?) AND is_active = 1
+            LIMIT 1
+        ''', (username,)).fetchone()
+
+        return dict(row) if row else None
 
     def get_creator_post_stats(self, creator_id: int) -> Dict:
         """Get post statistics for a creator efficiently"""
@@ -311,7 +526,8 @@ class DatabaseManager:
             SELECT
                 COUNT(*) as total_posts,
                 COUNT(CASE WHEN transcript IS NOT NULL AND transcript != '' THEN 1 END) as transcribed_posts,
-                COUNT(CASE WHEN post_type = 'video' THEN 1 END) as video_posts
+                COUNT(CASE WHEN post_type = 'video' THEN 1 END) as video_posts,
+                COUNT(CASE WHEN likes > 1000 THEN 1 END) as high_engagement_posts
             FROM posts
             WHERE creator_id = ?
         ''', (creator_id,))
@@ -326,24 +542,103 @@ class DatabaseManager:
             "total_posts": result[0] if result else 0,
             "transcribed_posts": result[1] if result else 0,
             "video_posts": result[2] if result else 0,
+            "high_engagement_posts": result[3] if result else 0,
             "knowledge_transcriptions": knowledge_stats['transcriptions'],
             "knowledge_chunks": knowledge_stats['chunks']
         }
 
+    def get_all_coaches_with_stats(self) -> List[Dict]:
+        """Get every active creator that has a coach profile, with post stats, in one query"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            SELECT
+                c.id,
+                c.username,
+                c.display_name,
+                c.platform,
+                (SELECT MAX(cp.updated_at) FROM coach_profiles cp WHERE cp.creator_id = c.id) as updated_at,
+                COUNT(p.id) as total_posts,
+                COUNT(CASE WHEN p.transcript IS NOT NULL AND p.transcript != '' THEN 1 END) as transcribed_posts
+            FROM creators c
+            LEFT JOIN posts p ON p.creator_id = c.id
+            WHERE c.is_active = 1
+              AND EXISTS (SELECT 1 FROM coach_profiles cp WHERE cp.creator_id = c.id)
+            GROUP BY c.id
+        ''')
+
+        coaches = []
+        for row in cursor.fetchall():
+            coach = dict(row)
+
+            # Knowledge base statistics come from the metadata files (source of truth)
+            knowledge_stats = self._get_knowledge_stats_from_files(coach['id'])
+            coach['knowledge_transcriptions'] = knowledge_stats['transcriptions']
+            coach['knowledge_chunks'] = knowledge_stats['chunks']
+            coaches.append(coach)
+
+        return coaches
+
+    def get_database_summary(self) -> List[Dict]:
+        """Get post counts, sample posts and coach profile details for every creator in one query"""
+        conn = self.get_connection()
+
+        cursor = conn.execute('''
+            SELECT
+                c.id,
+                c.username,
+                COUNT(p.id) as total_posts,
+                COUNT(CASE WHEN substr(p.post_id, 1, 5) = 'mock_' THEN 1 END) as mock_posts,
+                (SELECT rp.post_id FROM posts rp
+                 WHERE rp.creator_id = c.id AND substr(rp.post_id, 1, 5) != 'mock_'
+                 ORDER BY rp.post_date DESC LIMIT 1) as sample_real_post,
+                (SELECT rp.caption_text FROM posts rp
+                 WHERE rp.creator_id = c.id AND substr(rp.post_id, 1, 5) != 'mock_'
+                 ORDER BY rp.post_date DESC LIMIT 1) as sample_real_caption,
+                (SELECT mp.post_id FROM posts mp
+                 WHERE mp.creator_id = c.id AND substr(mp.post_id, 1, 5) = 'mock_'
+                 ORDER BY mp.post_date DESC LIMIT 1) as sample_mock_post,
+                EXISTS (SELECT 1 FROM coach_profiles cp WHERE cp.creator_id = c.id) as has_coach_profile,
+                (SELECT json_array_length(cp.expertise_areas) FROM coach_profiles cp
+                 WHERE cp.creator_id = c.id ORDER BY cp.updated_at DESC LIMIT 1) as expertise_area_count,
+                (SELECT MAX(cp.updated_at) FROM coach_profiles cp WHERE cp.creator_id = c.id) as profile_updated_at
+            FROM creators c
+            LEFT JOIN posts p ON p.creator_id = c.id
+            WHERE c.is_active = 1
+            GROUP BY c.id
+        ''')
+
+        summary = []
+        for row in cursor.fetchall():
+            creator = dict(row)
+            creator['real_posts'] = creator['total_posts'] - creator['mock_posts']
+            creator['has_coach_profile'] = bool(creator['has_coach_profile'])
+            summary.append(creator)
+
+        return summary
+
     def _get_knowledge_stats_from_files(self, creator_id: int) -> Dict:
-        """Get knowledge base statistics from JSON metadata files"""
+        """Get knowledge base statistics from chunk metadata files"""
         import json
         import os
 
         kb_dir = f'knowledge_base/creator_{creator_id}'
+        msgpack_file = os.path.join(kb_dir, 'chunk_metadata.msgpack')
         metadata_file = os.path.join(kb_dir, 'chunk_metadata.json')
 
-        if not os.path.exists(metadata_file):
+        if not os.path.exists(msgpack_file) and not os.path.exists(metadata_file):
             return {'transcriptions': 0, 'chunks': 0}
 
         try:
-            with open(metadata_file, 'r') as f:
-                chunks = json.load(f)
+            # Knowledge bases are saved as MessagePack; older ones only have JSON
+            if os.path.exists(msgpack_file):
+                import msgpack
+                with open(msgpack_file, 'rb') as f:
+                    chunks = msgpack.unpackb(f.read(), raw=False)
+            else:
+                with open(metadata_file, 'r') as f:
+                    chunks = json.load(f)
 
             # Count unique post IDs and total chunks
             unique_posts = set()
@@ -358,49 +653,116 @@ class DatabaseManager:
                 'transcriptions': len(unique_posts),
                 'chunks': total_chunks
             }
-        except (json.JSONDecodeError, FileNotFoundError, KeyError):
+        except (ValueError, FileNotFoundError, KeyError):
             return {'transcriptions': 0, 'chunks': 0}
 
     def delete_post(self, post_id: str) -> bool:
         """Delete a post by post_id"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        with self.transaction() as conn:
+            # Also delete associated knowledge chunks
+            conn.execute('DELETE FROM knowledge_chunks WHERE post_id IN (SELECT id FROM posts WHERE post_id = ?)', (post_id,))
 
-        # Also delete associated knowledge chunks
-        cursor.execute('DELETE FROM knowledge_chunks WHERE post_id IN (SELECT id FROM posts WHERE post_id = ?)', (post_id,))
+            # Delete the post
+            cursor = conn.execute('DELETE FROM posts WHERE post_id = ?', (post_id,))
 
-        # Delete the post
-        cursor.execute('DELETE FROM posts WHERE post_id = ?', (post_id,))
+        return cursor.rowcount > 0
 
-        deleted = cursor.rowcount > 0
-        conn.commit()
-        conn.close()
-        return deleted
+    def delete_posts(self, post_ids: List[str]) -> List[str]:
+        """Delete many posts by post_id in one transaction; returns the post_ids that were deleted"""
+        ids_json = json.dumps([str(post_id) for post_id in post_ids])
 
-    def delete_creator(self, creator_id: int) -> bool:
-        """Delete a creator and all associated data"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        with self.transaction() as conn:
+            deleted = [row[0] for row in conn.execute(
+                'SELECT post_id FROM posts WHERE post_id IN (SELECT value FROM json_each(?))', (ids_json,)
+            )]
 
-        # Delete in order due to foreign key constraints
-        cursor.execute('DELETE FROM knowledge_chunks WHERE creator_id = ?', (creator_id,))
-        cursor.execute('DELETE FROM coach_profiles WHERE creator_id = ?', (creator_id,))
-        cursor.execute('DELETE FROM posts WHERE creator_id = ?', (creator_id,))
-        cursor.execute('DELETE FROM creators WHERE id = ?', (creator_id,))
+            # Also delete associated knowledge chunks
+            conn.execute('''
+                DELETE FROM knowledge_chunks
+                WHERE post_id IN (SELECT id FROM posts WHERE post_id IN (SELECT value FROM json_each(?)))
+            ''', (ids_json,))
+
+            conn.executemany('DELETE FROM posts WHERE post_id = ?', [(post_id,) for post_id in deleted])
 
-        deleted = cursor.rowcount > 0
-        conn.commit()
-        conn.close()
         return deleted
 
+    def delete_creator(self, creator_id: int) -> bool:
+        """Delete a creator and all associated data"""
+        with self.transaction() as conn:
+            # Delete in order due to foreign key constraints
+            conn.execute('''
+                DELETE FROM chat_messages
+                WHERE session_id IN (SELECT id FROM chat_sessions WHERE creator_id = ?)
+            ''', (creator_id,))
+            conn.execute('DELETE FROM chat_sessions WHERE creator_id = ?', (creator_id,))
+            conn.execute('DELETE FROM jobs WHERE creator_id = ?', (creator_id,))
+            conn.execute('DELETE FROM knowledge_chunks WHERE creator_id = ?', (creator_id,))
+            conn.execute('DELETE FROM coach_profiles WHERE creator_id = ?', (creator_id,))
+            conn.execute('DELETE FROM posts WHERE creator_id = ?', (creator_id,))
+            cursor = conn.execute('DELETE FROM creators WHERE id = ?', (creator_id,))
+
+        self._profile_cache.pop(creator_id, None)
+        return cursor.rowcount > 0
+
     def update_post_transcript(self, post_id: str, transcript: str) -> bool:
         """Update a post's transcript"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        with self.transaction() as conn:
+            cursor = conn.execute('UPDATE posts SET transcript = ? WHERE post_id = ?', (transcript, post_id))
+
+        return cursor.rowcount > 0
+
+    def create_chat_session(self, creator_id: int, session_title: str = None) -> int:
+        """Start a chat session with a creator's coach"""
+        with self.transaction() as conn:
+            cursor = conn.execute('''
+                INSERT INTO chat_sessions (creator_id, session_title) VALUES (?, ?)
+            ''', (creator_id, session_title))
+
+        return cursor.lastrowid
+
+    def create_job(self, job_id: str, job_type: str, creator_id: int = None, worker_pid: int = None):
+        """Record a newly queued background job"""
+        with self.transaction() as conn:
+            conn.execute('''
+                INSERT INTO jobs (id, job_type, creator_id, worker_pid) VALUES (?, ?, ?, ?)
+            ''', (job_id, job_type, creator_id, worker_pid))
+
+    def get_unfinished_jobs(self) -> List[Dict]:
+        """Get jobs that are still queued or running"""
+        conn = self.get_connection()
+
+        cursor = conn.execute("SELECT id, worker_pid FROM jobs WHERE status IN ('queued', 'running')")
+        return [dict(row) for row in cursor.fetchall()]
+
+    def update_job(self, job_id: str, status: str, result: Dict = None, error: str = None) -> bool:
+        """Move an unfinished job to a new status, storing its result or error"""
+        with self.transaction() as conn:
+            # Finished and failed are final, so a job already marked failed is never revived
+            cursor = conn.execute('''
+                UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND status IN ('queued', 'running')
+            ''', (status, json.dumps(result) if result is not None else None, error, job_id))
+
+        return cursor.rowcount > 0
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        """Get a background job with its decoded result"""
+        conn = self.get_connection()
+
+        row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if not row:
+            return None
+
+        job = dict(row)
+        job['result'] = _json_loads(job['result']) if job['result'] else None
+        return job
 
-        cursor.execute('UPDATE posts SET transcript = ? WHERE post_id = ?', (transcript, post_id))
+    def add_chat_messages_bulk(self, messages: List[Tuple]) -> int:
+        """Add (session_id, message_type, content, referenced_chunks) rows in one transaction"""
+        with self.transaction() as conn:
+            conn.executemany('''
+                INSERT INTO chat_messages (session_id, message_type, content, referenced_chunks)
+                VALUES (?, ?, ?, ?)
+            ''', messages)
 
-        updated = cursor.rowcount > 0
-        conn.commit()
-        conn.close()
-        return updated
\ No newline at end of file
+        return len(messages)
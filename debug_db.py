@@ -2,35 +2,30 @@
 from database.models import DatabaseManager
 
 db = DatabaseManager()
-creators = db.get_creators()
+summary = db.get_database_summary()
 
 print("DATABASE CONTENTS:")
 print("=" * 50)
 
-for creator in creators:
-    posts = db.get_creator_posts(creator['id'])
-    coach_profile = db.get_coach_profile(creator['id'])
-
+for creator in summary:
     print(f"Creator {creator['id']}: @{creator['username']}")
-    print(f"  - Posts: {len(posts)}")
-    print(f"  - Coach Profile: {'✅' if coach_profile else '❌'}")
-
-    if posts:
-        real_posts = [p for p in posts if not p['post_id'].startswith('mock_')]
-        mock_posts = [p for p in posts if p['post_id'].startswith('mock_')]
-        print(f"  - Real posts: {len(real_posts)}")
-        print(f"  - Mock posts: {len(mock_posts)}")
-
-        if real_posts:
-            print(f"  - Sample real post: {real_posts[0]['post_id']}")
-            caption = (real_posts[0]['caption_text'] or '')[:100]
+    print(f"  - Posts: {creator['total_posts']}")
+    print(f"  - Coach Profile: {'✅' if creator['has_coach_profile'] else '❌'}")
+
+    if creator['total_posts']:
+        print(f"  - Real posts: {creator['real_posts']}")
+        print(f"  - Mock posts: {creator['mock_posts']}")
+
+        if creator['sample_real_post']:
+            print(f"  - Sample real post: {creator['sample_real_post']}")
+            caption = (creator['sample_real_caption'] or '')[:100]
             print(f"  - Caption preview: {caption}...")
 
-        if mock_posts:
-            print(f"  - Sample mock post: {mock_posts[0]['post_id']}")
+        if creator['sample_mock_post']:
+            print(f"  - Sample mock post: {creator['sample_mock_post']}")
 
-    if coach_profile:
-        print(f"  - Expertise areas: {len(coach_profile.get('expertise_areas', []))}")
-        print(f"  - Analysis date: {coach_profile.get('analysis_date', 'N/A')}")
+    if creator['has_coach_profile']:
+        print(f"  - Expertise areas: {creator['expertise_area_count'] or 0}")
+        print(f"  - Analysis date: {creator['profile_updated_at'] or 'N/A'}")
 
-    print()
\ No newline at end of file
+    print()
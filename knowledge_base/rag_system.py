@@ -1,33 +1,241 @@
 import openai
 import numpy as np
+import pandas as pd
 import faiss
 import pickle
+import copy
 import json
-from typing import List, Dict, Tuple, Optional
-from sentence_transformers import SentenceTransformer
+import msgpack
+import hashlib
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import cache
+from typing import Callable, List, Dict, Tuple, Optional
 import tiktoken
 
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
+# Models are loaded once per process and shared by every knowledge base and clone
+_models_lock = threading.Lock()
+
+@cache
+def _load_sentence_model():
+    """Sentence transformer for backup embeddings"""
+    # Importing sentence_transformers pulls in torch, so defer it as well
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer('all-MiniLM-L6-v2')
+
+@cache
+def _load_encoding():
+    """Tokenizer used to size chunks"""
+    return tiktoken.encoding_for_model("gpt-3.5-turbo")
+
+class BatchedEmbedder:
+    """
+    Micro-batches concurrent embedding requests
+    Callers block on embed() while a worker thread coalesces pending texts into one batch call
+    """
+
+    def __init__(self, embed_fn: Callable[[List[str]], np.ndarray], max_batch: int = 32, max_wait_ms: int = 20,
+                 timeout: float = 120.0):
+        self.embed_fn = embed_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.timeout = timeout  # longest a caller waits for its batch to be embedded
+        self._queue = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+    def embed(self, text: str) -> np.ndarray:
+        """Embed a single text, sharing the API call with any concurrent requests"""
+        future = Future()
+        self._ensure_worker()
+        self._queue.put((text, future))
+        return future.result(timeout=self.timeout)
+
+    def _ensure_worker(self):
+        """Start the batching thread on first use"""
+        if self._worker is not None:
+            return
+        with self._worker_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="batched-embedder", daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        """Collect requests for up to max_wait or max_batch, then resolve them with one call"""
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            texts = [text for text, _ in batch]
+            try:
+                vectors = self.embed_fn(texts)
+                if len(vectors) != len(batch):
+                    raise ValueError(f"Expected {len(batch)} embeddings, got {len(vectors)}")
+                for row, (_, future) in enumerate(batch):
+                    future.set_result(vectors[row])
+            except Exception as e:
+                # Fail the whole batch rather than letting the worker thread die
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+class EmbeddingCache:
+    """
+    Persistent content-addressed embedding store
+    Vectors are keyed by sha256(model + text) and kept as float16 in SQLite
+    """
+
+    def __init__(self, db_path: str = "knowledge_base/embedding_cache.db"):
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL
+            )
+        ''')
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(model: str, text: str) -> str:
+        """Cache key for a text embedded with a given model"""
+        return hashlib.sha256((model + "\0" + text).encode()).hexdigest()
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        """Return the cached float32 vectors for whichever keys are present"""
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+
+        with self._lock:
+            # Stay well under SQLite's bound-parameter limit
+            for i in range(0, len(unique_keys), 500):
+                batch = unique_keys[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                )
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype='float16').astype('float32')
+
+        return found
+
+    def put_many(self, items: List[Tuple[str, np.ndarray]]):
+        """Store vectors as float16"""
+        rows = [(key, np.asarray(vector, dtype='float16').tobytes()) for key, vector in items]
+
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", rows
+                )
+
+class KeywordMatcher:
+    """
+    Finds which categories have a keyword in a text
+    Uses one Aho-Corasick scan per text when pyahocorasick is installed
+    """
+
+    def __init__(self, keywords: List[Tuple[str, object]]):
+        # An empty keyword is a substring of everything, so its category always matches
+        self._always = {category for keyword, category in keywords if not keyword}
+        self._pairs = [(keyword, category) for keyword, category in keywords if keyword]
+        self._automaton = None
+
+        if AHOCORASICK_AVAILABLE and self._pairs:
+            self._automaton = ahocorasick.Automaton()
+            for keyword, category in self._pairs:
+                categories = self._automaton.get(keyword, set())
+                categories.add(category)
+                self._automaton.add_word(keyword, categories)
+            self._automaton.make_automaton()
+
+    def match(self, text_lower: str) -> set:
+        """Return the categories whose keywords occur in the lowercased text"""
+        found = set(self._always)
+
+        if self._automaton is not None:
+            for _, categories in self._automaton.iter(text_lower):
+                found.update(categories)
+        else:
+            for keyword, category in self._pairs:
+                if category not in found and keyword in text_lower:
+                    found.add(category)
+
+        return found
+
 class RAGKnowledgeBase:
     """
     RAG system for creator coach knowledge base
     Chunks content by strategy/topic and enables semantic search
     """
 
+    # Weight of a chunk's content quality in its search ranking
+    QUALITY_BOOST = 0.1
+
     def __init__(self, openai_api_key: str, database_manager=None, embedding_model: str = "text-embedding-ada-002"):
         self.openai_client = openai.OpenAI(api_key=openai_api_key)
         self.embedding_model = embedding_model
         self.db = database_manager
 
-        # Initialize sentence transformer for backup embeddings
-        self.sentence_model = SentenceTransformer('all-MiniLM-L6-v2')
-
         # FAISS index for vector search
         self.index = None
         self.chunk_metadata = []
         self.embedding_dimension = 1536  # OpenAI ada-002 dimension
-
-        # Token counter for chunk sizing
-        self.encoding = tiktoken.encoding_for_model("gpt-3.5-turbo")
+        # HNSW graph over fp16 scalar-quantized vectors: half the memory of flat fp32.
+        # Large creators can use e.g. "IVF256,SQ8" for stronger compression.
+        self.faiss_index_factory = "HNSW32,SQfp16"
+        self.hnsw_ef_search = 64  # HNSW candidate list size at query time
+
+        # Coalesces concurrent query embeddings into one API call
+        self.query_embedder = BatchedEmbedder(self._embed_query_batch)
+
+        # Embedding requests kept in flight while building a knowledge base
+        self.embedding_concurrency = 5
+
+        # Unchanged chunks reuse their stored embeddings instead of calling the API again
+        self.embedding_cache = EmbeddingCache()
+
+    def clone(self) -> 'RAGKnowledgeBase':
+        """Knowledge base with its own index and chunks, sharing this one's clients and caches"""
+        # index and chunk_metadata are replaced wholesale by build/load, so each creator's
+        # coach or rebuild needs its own instance to avoid searching someone else's index
+        knowledge_base = copy.copy(self)
+        knowledge_base.index = None
+        knowledge_base.chunk_metadata = []
+        return knowledge_base
+
+    @property
+    def sentence_model(self):
+        """Sentence transformer for backup embeddings, loaded on first fallback"""
+        with _models_lock:
+            return _load_sentence_model()
+
+    @property
+    def encoding(self):
+        """Token counter for chunk sizing, loaded when content is first chunked"""
+        with _models_lock:
+            return _load_encoding()
 
     def create_knowledge_base(self, creator_id: int, posts: List[Dict], coach_profile: Dict) -> Dict:
         """
@@ -39,14 +247,14 @@ class RAGKnowledgeBase:
         all_chunks = self._chunk_content_strategically(posts, coach_profile)
 
         # Step 2: Generate embeddings
-        embeddings = self._generate_embeddings(all_chunks)
+        embeddings, normalized = self._generate_embeddings(all_chunks)
 
         # Step 3: Save chunks to database
         if self.db:
             self._save_chunks_to_database(creator_id, all_chunks, embeddings)
 
         # Step 4: Build FAISS index
-        self._build_faiss_index(embeddings, all_chunks, creator_id)
+        self._build_faiss_index(embeddings, all_chunks, creator_id, normalized)
 
         # Step 5: Save knowledge base
         self._save_knowledge_base(creator_id)
@@ -65,15 +273,29 @@ class RAGKnowledgeBase:
         """
         chunks = []
 
+        # Tokenize every caption and transcript in one multi-threaded tiktoken call
+        texts = [
+            text
+            for post in posts
+            for text in (post.get('caption_text'), post.get('transcript'))
+            if text
+        ]
+        all_tokens = iter(self.encoding.encode_batch(texts, num_threads=os.cpu_count() or 1))
+
         for post in posts:
             post_chunks = []
 
+            # Every chunk of a post shares one metadata dict
+            post_metadata = self._extract_post_metadata(post)
+
             # Strategy 1: Caption content chunking
             if post.get('caption_text'):
                 caption_chunks = self._chunk_semantically(
                     post['caption_text'],
                     post,
-                    "caption"
+                    "caption",
+                    next(all_tokens),
+                    post_metadata
                 )
                 post_chunks.extend(caption_chunks)
 
@@ -82,25 +304,33 @@ class RAGKnowledgeBase:
                 transcript_chunks = self._chunk_semantically(
                     post['transcript'],
                     post,
-                    "transcript"
+                    "transcript",
+                    next(all_tokens),
+                    post_metadata
                 )
                 post_chunks.extend(transcript_chunks)
 
             # Strategy 3: High-engagement posts get priority chunking
             if post.get('likes', 0) > 1000 or post.get('engagement_rate', 0) > 500:
-                engagement_chunk = self._create_high_value_chunk(post)
+                engagement_chunk = self._create_high_value_chunk(post, post_metadata)
                 if engagement_chunk:
                     post_chunks.append(engagement_chunk)
 
             chunks.extend(post_chunks)
 
+        # Score all semantic chunks at once
+        self._assess_content_quality(chunks)
+
         return chunks
 
-    def _chunk_semantically(self, content: str, post: Dict, content_type: str) -> List[Dict]:
+    def _chunk_semantically(self, content: str, post: Dict, content_type: str, tokens: Optional[List[int]] = None,
+                            post_metadata: Optional[Dict] = None) -> List[Dict]:
         """
         Semantic chunking optimized for RAG search
         """
         chunks = []
+        if post_metadata is None:
+            post_metadata = self._extract_post_metadata(post)
 
         # Smart chunking based on content length and type
         if content_type == "transcript":
@@ -111,7 +341,7 @@ class RAGKnowledgeBase:
             chunk_size = 100  # tokens per chunk for captions
 
         # Split into semantic chunks
-        chunk_texts = self._chunk_by_tokens(content, chunk_size)
+        chunk_texts = self._chunk_by_tokens(content, chunk_size, tokens)
 
         for i, chunk_text in enumerate(chunk_texts):
             if len(chunk_text.strip()) < 20:  # Skip very short chunks
@@ -121,41 +351,44 @@ class RAGKnowledgeBase:
                 "chunk_text": chunk_text.strip(),
                 "chunk_type": f"semantic_{content_type}",
                 "topic_tags": [content_type],
-                "post_metadata": self._extract_post_metadata(post),
-                "chunk_index": i,
-                "content_quality": self._assess_content_quality(chunk_text, post)
+                "post_metadata": post_metadata,
+                "chunk_index": i
             }
             chunks.append(chunk)
 
         return chunks
 
-    def _assess_content_quality(self, text: str, post: Dict) -> float:
+    def _assess_content_quality(self, chunks: List[Dict]):
         """
-        Simple content quality assessment for ranking chunks
+        Simple content quality assessment for ranking chunks, scored in one vectorized pass
+        over every chunk that does not already have a quality score
         """
-        quality_score = 0.0
+        pending = [chunk for chunk in chunks if "content_quality" not in chunk]
+        if not pending:
+            return
+
+        df = pd.DataFrame({
+            "text": [chunk["chunk_text"] for chunk in pending],
+            "likes": [chunk["post_metadata"].get("likes") for chunk in pending]
+        })
+        lower_text = df["text"].str.lower()
+        likes = pd.to_numeric(df["likes"], errors="coerce").fillna(0)
 
         # Length factor (not too short, not too long)
-        text_length = len(text.split())
-        if 15 <= text_length <= 150:
-            quality_score += 0.3
+        word_count = df["text"].str.split().str.len()
+        quality = np.where(word_count.between(15, 150), 0.3, 0.0)
 
         # Engagement factor
-        likes = post.get('likes', 0)
-        if likes > 1000:
-            quality_score += 0.4
-        elif likes > 500:
-            quality_score += 0.2
+        quality = quality + np.select([likes > 1000, likes > 500], [0.4, 0.2], 0.0)
 
         # Content richness (questions, actionable advice)
-        if '?' in text:
-            quality_score += 0.1
-        if any(word in text.lower() for word in ['how to', 'tip', 'strategy', 'step']):
-            quality_score += 0.2
+        quality = quality + np.where(df["text"].str.contains("?", regex=False), 0.1, 0.0)
+        quality = quality + np.where(lower_text.str.contains("how to|tip|strategy|step", regex=True), 0.2, 0.0)
 
-        return min(quality_score, 1.0)
+        for chunk, score in zip(pending, np.minimum(quality, 1.0).tolist()):
+            chunk["content_quality"] = score
 
-    def _create_high_value_chunk(self, post: Dict) -> Optional[Dict]:
+    def _create_high_value_chunk(self, post: Dict, post_metadata: Optional[Dict] = None) -> Optional[Dict]:
         """
         Create prioritized chunk for high-engagement content
         """
@@ -169,7 +402,7 @@ class RAGKnowledgeBase:
             "chunk_text": content,
             "chunk_type": "high_value",
             "topic_tags": ["viral", "high_engagement"],
-            "post_metadata": self._extract_post_metadata(post),
+            "post_metadata": post_metadata if post_metadata is not None else self._extract_post_metadata(post),
             "engagement_metrics": {
                 "likes": post.get('likes', 0),
                 "comments": post.get('comments', 0),
@@ -183,32 +416,44 @@ class RAGKnowledgeBase:
         Chunk content based on identified strategies and frameworks
         """
         chunks = []
+        post_metadata = self._extract_post_metadata(post)
 
         # Split content into sentences for strategic chunking
         sentences = content.split('. ')
 
+        # Match every framework and expertise area keyword in one scan per sentence
+        keywords = []
+        for i, framework in enumerate(frameworks):
+            keywords.append((framework['name'].lower(), ('framework', i)))
+            keywords.extend((keyword.lower(), ('framework', i)) for keyword in framework.get('key_components', []))
+        for i, area in enumerate(expertise_areas):
+            keywords.extend((keyword, ('area', i)) for keyword in area.lower().split())
+
+        matcher = KeywordMatcher(keywords)
+        sentence_matches = [matcher.match(sentence.lower()) for sentence in sentences]
+
         # Strategy 1: Framework-based chunking
-        for framework in frameworks:
-            framework_content = self._extract_framework_content(sentences, framework)
+        for i, framework in enumerate(frameworks):
+            framework_content = self._extract_matching_content(sentences, sentence_matches, ('framework', i))
             if framework_content:
                 chunks.append({
                     "chunk_text": framework_content,
                     "chunk_type": f"framework_{content_type}",
                     "topic_tags": [framework['name'], content_type],
-                    "post_metadata": self._extract_post_metadata(post),
+                    "post_metadata": post_metadata,
                     "framework_reference": framework['name'],
                     "expertise_area": self._match_expertise_area(framework_content, expertise_areas)
                 })
 
         # Strategy 2: Topic-based chunking
-        for area in expertise_areas:
-            topic_content = self._extract_topic_content(sentences, area)
+        for i, area in enumerate(expertise_areas):
+            topic_content = self._extract_matching_content(sentences, sentence_matches, ('area', i))
             if topic_content:
                 chunks.append({
                     "chunk_text": topic_content,
                     "chunk_type": f"expertise_{content_type}",
                     "topic_tags": [area, content_type],
-                    "post_metadata": self._extract_post_metadata(post),
+                    "post_metadata": post_metadata,
                     "expertise_area": area
                 })
 
@@ -222,50 +467,31 @@ class RAGKnowledgeBase:
                     "chunk_text": chunk_text,
                     "chunk_type": f"general_{content_type}",
                     "topic_tags": [content_type],
-                    "post_metadata": self._extract_post_metadata(post),
+                    "post_metadata": post_metadata,
                     "expertise_area": "general"
                 })
 
         return chunks
 
-    def _extract_framework_content(self, sentences: List[str], framework: Dict) -> str:
-        """Extract sentences related to a specific framework"""
-        framework_name = framework['name'].lower()
-        framework_keywords = framework.get('key_components', [])
-
-        relevant_sentences = []
-
-        for sentence in sentences:
-            sentence_lower = sentence.lower()
-            if (framework_name in sentence_lower or
-                any(keyword.lower() in sentence_lower for keyword in framework_keywords)):
-                relevant_sentences.append(sentence.strip())
+    def _extract_matching_content(self, sentences: List[str], sentence_matches: List[set], category: Tuple) -> str:
+        """Extract sentences whose keywords matched a framework or expertise area"""
+        relevant_sentences = [
+            sentence.strip()
+            for sentence, matched in zip(sentences, sentence_matches)
+            if category in matched
+        ]
 
         return '. '.join(relevant_sentences) if relevant_sentences else ""
 
-    def _extract_topic_content(self, sentences: List[str], expertise_area: str) -> str:
-        """Extract sentences related to expertise area"""
-        area_keywords = expertise_area.lower().split()
-        relevant_sentences = []
+    def _chunk_by_tokens(self, text: str, max_tokens: int, tokens: Optional[List[int]] = None) -> List[str]:
+        """Chunk text by token count; pass tokens if the text is already encoded"""
+        if tokens is None:
+            tokens = self.encoding.encode(text)
 
-        for sentence in sentences:
-            sentence_lower = sentence.lower()
-            if any(keyword in sentence_lower for keyword in area_keywords):
-                relevant_sentences.append(sentence.strip())
-
-        return '. '.join(relevant_sentences) if relevant_sentences else ""
-
-    def _chunk_by_tokens(self, text: str, max_tokens: int) -> List[str]:
-        """Chunk text by token count"""
-        tokens = self.encoding.encode(text)
-        chunks = []
-
-        for i in range(0, len(tokens), max_tokens):
-            chunk_tokens = tokens[i:i + max_tokens]
-            chunk_text = self.encoding.decode(chunk_tokens)
-            chunks.append(chunk_text)
-
-        return chunks
+        # Decode all slices in a single call into tiktoken's Rust core
+        return self.encoding.decode_batch([
+            tokens[i:i + max_tokens] for i in range(0, len(tokens), max_tokens)
+        ])
 
     def _create_engagement_chunk(self, post: Dict) -> Optional[Dict]:
         """Create special chunk for high-engagement posts"""
@@ -308,47 +534,92 @@ class RAGKnowledgeBase:
 
         return "general"
 
-    def _generate_embeddings(self, chunks: List[Dict]) -> np.ndarray:
-        """Generate embeddings for all chunks"""
+    def _generate_embeddings(self, chunks: List[Dict]) -> Tuple[np.ndarray, bool]:
+        """Generate embeddings for all chunks; also reports whether they are already L2-normalized"""
         print("Generating embeddings...")
 
         texts = [chunk["chunk_text"] for chunk in chunks]
-        embeddings = []
+        keys = [EmbeddingCache.make_key(self.embedding_model, text) for text in texts]
+
+        # Only texts without a cached embedding go to the API
+        cached = self.embedding_cache.get_many(keys)
+        embeddings = [cached.get(key) for key in keys]
+        missing = [i for i, vector in enumerate(embeddings) if vector is None]
+        print(f"Embedding cache: {len(texts) - len(missing)} hits, {len(missing)} misses")
 
-        # Use OpenAI embeddings in batches
+        # Use OpenAI embeddings in batches, several requests in flight at once
         batch_size = 100
-        for i in range(0, len(texts), batch_size):
-            batch = texts[i:i + batch_size]
+        batches = [missing[i:i + batch_size] for i in range(0, len(missing), batch_size)]
+
+        fresh = []
+        failed = False
+        with ThreadPoolExecutor(max_workers=self.embedding_concurrency) as executor:
+            futures = [executor.submit(self._embed_batch, [texts[i] for i in batch]) for batch in batches]
+
+            for batch, future in zip(batches, futures):
+                try:
+                    batch_embeddings = future.result()
+                except Exception as e:
+                    print(f"OpenAI embedding failed: {e}")
+                    failed = True
+                    continue
 
-            try:
-                response = self.openai_client.embeddings.create(
-                    model=self.embedding_model,
-                    input=batch
-                )
+                for i, vector in zip(batch, batch_embeddings):
+                    embeddings[i] = vector
+                    fresh.append((keys[i], vector))
+
+        # Batches that did succeed are still worth caching for the next run
+        if fresh:
+            self.embedding_cache.put_many(fresh)
+
+        if failed:
+            # Mixing models would give vectors of different dimensions, so re-embed everything
+            print("Using sentence transformer for all chunks")
+            fallback = self.sentence_model.encode(
+                texts,
+                batch_size=64,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=False
+            )
+            return fallback.astype('float32', copy=False), True
 
-                batch_embeddings = [data.embedding for data in response.data]
-                embeddings.extend(batch_embeddings)
+        return np.array(embeddings, dtype='float32'), False
 
-            except Exception as e:
-                print(f"OpenAI embedding failed, using sentence transformer: {e}")
-                # Fallback to sentence transformer
-                batch_embeddings = self.sentence_model.encode(batch)
-                embeddings.extend(batch_embeddings.tolist())
+    def _embed_batch(self, batch: List[str]) -> List[List[float]]:
+        """Embed one batch of texts with OpenAI"""
+        response = self.openai_client.embeddings.create(
+            model=self.embedding_model,
+            input=batch
+        )
 
-        return np.array(embeddings, dtype='float32')
+        return [data.embedding for data in response.data]
 
-    def _build_faiss_index(self, embeddings: np.ndarray, chunks: List[Dict], creator_id: int):
+    def _build_faiss_index(self, embeddings: np.ndarray, chunks: List[Dict], creator_id: int, normalized: bool = False):
         """Build FAISS index for fast similarity search"""
         print("Building FAISS index...")
 
-        # Create FAISS index
-        self.index = faiss.IndexFlatIP(embeddings.shape[1])  # Inner product for cosine similarity
-
         # Normalize embeddings for cosine similarity
-        faiss.normalize_L2(embeddings)
+        if not normalized:
+            faiss.normalize_L2(embeddings)
+
+        # Append a quality column so that, against a query padded with 1.0,
+        # the inner product is cosine + QUALITY_BOOST * quality in a single dot product
+        quality = np.array([chunk.get('content_quality', 0.5) for chunk in chunks], dtype='float32')
+        vectors = np.hstack([embeddings, (self.QUALITY_BOOST * quality)[:, None]])
+
+        # Create index from the factory string; inner product on unit vectors is cosine similarity
+        self.index = faiss.index_factory(vectors.shape[1], self.faiss_index_factory, faiss.METRIC_INNER_PRODUCT)
+        if hasattr(self.index, 'hnsw'):
+            self.index.hnsw.efConstruction = 200
+            self.index.hnsw.efSearch = self.hnsw_ef_search
+
+        # Quantizers such as PQ and IVF must be trained before vectors are added
+        if not self.index.is_trained:
+            self.index.train(vectors)
 
         # Add embeddings to index
-        self.index.add(embeddings)
+        self.index.add(vectors)
 
         # Store chunk metadata
         self.chunk_metadata = chunks
@@ -362,57 +633,53 @@ class RAGKnowledgeBase:
 
         print("Saving knowledge chunks to database...")
 
-        # Clear existing chunks for this creator
-        self.db.delete_creator_knowledge_chunks(creator_id)
+        # Map post_id strings to database ids once instead of reloading posts per chunk
+        pid_map = {post['post_id']: post['id'] for post in self.db.get_creator_posts(creator_id)}
 
-        # Save each chunk with its embedding
-        saved_count = 0
+        chunk_rows = []
+        kept_indices = []
         for i, chunk in enumerate(chunks):
-            try:
-                # Find the associated post
-                post_id = None
-                post_id_str = chunk.get('post_metadata', {}).get('post_id')
-                if post_id_str:
-                    # Get the database post ID from post_id string
-                    posts = self.db.get_creator_posts(creator_id)
-                    for post in posts:
-                        if post['post_id'] == post_id_str:
-                            post_id = post['id']  # Database ID
-                            break
-
-                if post_id is None:
-                    print(f"Warning: Could not find post_id for chunk {i}")
-                    continue
+            post_id = pid_map.get(chunk.get('post_metadata', {}).get('post_id'))
 
-                # Prepare chunk data with embedding
-                chunk_data = {
-                    'chunk_text': chunk['chunk_text'],
-                    'chunk_type': chunk['chunk_type'],
-                    'topic_tags': chunk.get('topic_tags', []),
-                    'embedding_vector': embeddings[i].tolist()  # Convert numpy array to list
-                }
+            if post_id is None:
+                print(f"Warning: Could not find post_id for chunk {i}")
+                continue
 
-                # Save to database
-                self.db.add_knowledge_chunk(creator_id, post_id, chunk_data)
-                saved_count += 1
+            chunk_rows.append({
+                'post_id': post_id,
+                'chunk_text': chunk['chunk_text'],
+                'chunk_type': chunk['chunk_type'],
+                'topic_tags': chunk.get('topic_tags', [])
+            })
+            kept_indices.append(i)
 
-            except Exception as e:
-                print(f"Error saving chunk {i}: {str(e)}")
+        # Embeddings stay one contiguous matrix; the database encodes it in a single pass
+        chunk_embeddings = embeddings[kept_indices]
+
+        # Replace the creator's chunks in a single transaction
+        saved_count = 0
+        try:
+            with self.db.transaction():
+                # Clear existing chunks for this creator
+                self.db.delete_creator_knowledge_chunks(creator_id)
+                saved_count = self.db.add_knowledge_chunks_bulk(creator_id, chunk_rows, chunk_embeddings)
+
+        except Exception as e:
+            print(f"Error saving knowledge chunks: {str(e)}")
 
         print(f"✓ Saved {saved_count} knowledge chunks to database")
 
     def _save_knowledge_base(self, creator_id: int):
         """Save knowledge base to disk"""
         kb_dir = f"knowledge_base/creator_{creator_id}"
-        import os
         os.makedirs(kb_dir, exist_ok=True)
 
         # Save FAISS index
         faiss.write_index(self.index, f"{kb_dir}/faiss_index.bin")
 
-        # Save metadata
-        with open(f"{kb_dir}/chunk_metadata.json", 'w') as f:
-            json.dump(self.chunk_metadata, f, indent=2)
+        # Save metadata as MessagePack: smaller and much faster to load than indented JSON
+        with open(f"{kb_dir}/chunk_metadata.msgpack", 'wb') as f:
+            f.write(msgpack.packb(self.chunk_metadata, use_bin_type=True))
 
         print(f"✓ Knowledge base saved to {kb_dir}")
 
@@ -424,9 +691,17 @@ class RAGKnowledgeBase:
             # Load FAISS index
             self.index = faiss.read_index(f"{kb_dir}/faiss_index.bin")
 
-            # Load metadata
-            with open(f"{kb_dir}/chunk_metadata.json", 'r') as f:
-                self.chunk_metadata = json.load(f)
+            # efSearch is not stored with the index; older knowledge bases are flat indexes
+            if hasattr(self.index, 'hnsw'):
+                self.index.hnsw.efSearch = self.hnsw_ef_search
+
+            # Load metadata, falling back to JSON for knowledge bases built before MessagePack
+            if os.path.exists(f"{kb_dir}/chunk_metadata.msgpack"):
+                with open(f"{kb_dir}/chunk_metadata.msgpack", 'rb') as f:
+                    self.chunk_metadata = msgpack.unpackb(f.read(), raw=False)
+            else:
+                with open(f"{kb_dir}/chunk_metadata.json", 'r') as f:
+                    self.chunk_metadata = json.load(f)
 
             print(f"✓ Knowledge base loaded for creator {creator_id}")
             return True
@@ -435,25 +710,40 @@ class RAGKnowledgeBase:
             print(f"Error loading knowledge base: {e}")
             return False
 
-    def search_knowledge(self, query: str, k: int = 5) -> List[Dict]:
-        """Search knowledge base for relevant chunks"""
-        if not self.index:
-            return []
-
+    def _embed_query_batch(self, queries: List[str]) -> np.ndarray:
+        """Embed a batch of queries in one call, falling back to sentence transformer"""
         try:
-            # Generate query embedding
             response = self.openai_client.embeddings.create(
                 model=self.embedding_model,
-                input=[query]
+                input=queries
             )
-            query_embedding = np.array([response.data[0].embedding], dtype='float32')
+            return np.array([data.embedding for data in response.data], dtype='float32')
 
         except:
             # Fallback to sentence transformer
-            query_embedding = np.array([self.sentence_model.encode([query])[0]], dtype='float32')
+            return np.asarray(self.sentence_model.encode(queries), dtype='float32')
+
+    def embed_query(self, query: str) -> np.ndarray:
+        """Embed a query and L2-normalize it for cosine similarity"""
+        query_embedding = self.query_embedder.embed(query).reshape(1, -1).copy()
 
         # Normalize query embedding
         faiss.normalize_L2(query_embedding)
+        return query_embedding
+
+    def search_knowledge(self, query: str, k: int = 5, query_embedding: Optional[np.ndarray] = None) -> List[Dict]:
+        """Search knowledge base for relevant chunks"""
+        if not self.index:
+            return []
+
+        # Callers that already embedded the query can pass it in to skip a second API call
+        if query_embedding is None:
+            query_embedding = self.embed_query(query)
+
+        # Indexes with a quality column already score similarity + quality boost
+        quality_in_index = self.index.d == query_embedding.shape[1] + 1
+        if quality_in_index:
+            query_embedding = np.hstack([query_embedding, np.ones((query_embedding.shape[0], 1), dtype='float32')])
 
         # Search index
         scores, indices = self.index.search(query_embedding, k)
@@ -461,17 +751,23 @@ class RAGKnowledgeBase:
         # Return results with metadata, prioritizing quality
         results = []
         for score, idx in zip(scores[0], indices[0]):
-            if idx < len(self.chunk_metadata):
+            # HNSW pads with -1 when it finds fewer than k neighbours
+            if 0 <= idx < len(self.chunk_metadata):
                 result = self.chunk_metadata[idx].copy()
-                result['similarity_score'] = float(score)
+                content_quality = result.get('content_quality', 0.5)
 
                 # Boost score for high-quality content
-                content_quality = result.get('content_quality', 0.5)
-                result['final_score'] = float(score) + (content_quality * 0.1)
+                if quality_in_index:
+                    result['final_score'] = float(score)
+                    result['similarity_score'] = float(score) - content_quality * self.QUALITY_BOOST
+                else:
+                    result['similarity_score'] = float(score)
+                    result['final_score'] = float(score) + (content_quality * self.QUALITY_BOOST)
 
                 results.append(result)
 
-        # Sort by final score (similarity + quality boost)
-        results.sort(key=lambda x: x['final_score'], reverse=True)
+        # Older indexes without the quality column still need a sort by final score
+        if not quality_in_index:
+            results.sort(key=lambda x: x['final_score'], reverse=True)
 
         return results
\ No newline at end of file
@@ -1,12 +1,16 @@
 import os
 import json
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from apify_client import ApifyClient
 import time
 import re
+from concurrent.futures import ThreadPoolExecutor
 
 class InstagramScraper:
+    # Hashtags and mentions in one pattern so each caption is scanned once
+    _TAG_PATTERN = re.compile(r'[#@](\w+)')
+
     def __init__(self, apify_token: str):
         self.client = ApifyClient(apify_token)
         self.actor_id = "apify/instagram-scraper"  # Popular Instagram scraper
@@ -53,6 +57,7 @@ class InstagramScraper:
 
         for post in raw_posts:
             try:
+                hashtags, mentions = self._extract_tags(post.get("caption", ""))
                 processed_post = {
                     "post_id": post.get("id") or post.get("shortCode"),
                     "post_type": self._determine_post_type(post),
@@ -62,8 +67,8 @@ class InstagramScraper:
                     "likes": post.get("likesCount", 0),
                     "comments": post.get("commentsCount", 0),
                     "views": post.get("videoViewCount", 0),
-                    "hashtags": self._extract_hashtags(post.get("caption", "")),
-                    "mentions": self._extract_mentions(post.get("caption", "")),
+                    "hashtags": hashtags,
+                    "mentions": mentions,
                     "duration": post.get("videoDurationInSeconds", 0),
                     "engagement_rate": self._calculate_engagement_rate(post)
                 }
@@ -117,23 +122,21 @@ class InstagramScraper:
         except:
             return None
 
-    def _extract_hashtags(self, caption: str) -> List[str]:
-        """Extract hashtags from caption"""
+    def _extract_tags(self, caption: str) -> Tuple[List[str], List[str]]:
+        """Extract hashtags and @mentions from caption"""
         if not caption:
-            return []
-
-        hashtag_pattern = r'#(\w+)'
-        hashtags = re.findall(hashtag_pattern, caption.lower())
-        return list(set(hashtags))  # Remove duplicates
-
-    def _extract_mentions(self, caption: str) -> List[str]:
-        """Extract @mentions from caption"""
-        if not caption:
-            return []
+            return [], []
+
+        # Dicts dedupe while keeping first-seen order, so re-scraped captions give identical lists
+        hashtags = {}
+        mentions = {}
+        for match in self._TAG_PATTERN.finditer(caption.lower()):
+            if match.group(0)[0] == '#':
+                hashtags[match.group(1)] = None
+            else:
+                mentions[match.group(1)] = None
 
-        mention_pattern = r'@(\w+)'
-        mentions = re.findall(mention_pattern, caption.lower())
-        return list(set(mentions))  # Remove duplicates
+        return list(hashtags), list(mentions)
 
     def _calculate_engagement_rate(self, post: Dict) -> float:
         """Calculate basic engagement rate"""
@@ -162,10 +165,24 @@ class InstagramScraper:
 class InstagramPostProcessor:
     """Process Instagram posts for video content extraction"""
 
-    def __init__(self, temp_dir: str = "temp_downloads"):
+    def __init__(self, temp_dir: str = "temp_downloads", max_workers: int = 8):
         self.temp_dir = temp_dir
+        self.max_workers = max_workers
+        self._session = None
         os.makedirs(temp_dir, exist_ok=True)
 
+    def _get_session(self):
+        """Shared HTTP session so downloads reuse TCP/TLS connections"""
+        if self._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            self._session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=self.max_workers, pool_maxsize=self.max_workers * 2)
+            self._session.mount('https://', adapter)
+            self._session.mount('http://', adapter)
+        return self._session
+
     def extract_video_posts(self, posts: List[Dict]) -> List[Dict]:
         """Filter and return only video posts that need transcription"""
         video_posts = []
@@ -177,19 +194,25 @@ class InstagramPostProcessor:
         print(f"Found {len(video_posts)} video posts for transcription")
         return video_posts
 
+    def download_videos(self, posts: List[Dict]) -> Dict[str, Optional[str]]:
+        """Download several videos in parallel; maps post_id to file path (None on failure)"""
+        # Create the session before the workers start so they all share one connection pool
+        self._get_session()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            paths = executor.map(lambda post: self.download_video(post["media_url"], post["post_id"]), posts)
+            return {post["post_id"]: path for post, path in zip(posts, paths)}
+
     def download_video(self, media_url: str, post_id: str) -> Optional[str]:
         """Download video temporarily for transcription"""
-        import requests
-
         try:
-            response = requests.get(media_url, stream=True)
-            response.raise_for_status()
+            with self._get_session().get(media_url, stream=True, timeout=60) as response:
+                response.raise_for_status()
 
-            file_path = os.path.join(self.temp_dir, f"{post_id}.mp4")
+                file_path = os.path.join(self.temp_dir, f"{post_id}.mp4")
 
-            with open(file_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
+                with open(file_path, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=65536):
+                        f.write(chunk)
 
             print(f"Downloaded video for post {post_id}")
             return file_path
@@ -1,203 +1,374 @@
 import os
-import openai
-from typing import Optional, Dict
-import tempfile
+import io
+import importlib.util
+import re
+import shelve
+import threading
+from typing import Iterator, Optional, Dict, Tuple
 import requests
+from requests.adapters import HTTPAdapter
 import subprocess
 import shutil
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-# Check if ffmpeg is available
-FFMPEG_AVAILABLE = shutil.which('ffmpeg') is not None
+# Check if ffmpeg is available; spawning the absolute path skips a PATH search per video
+FFMPEG_BIN = shutil.which('ffmpeg')
+FFMPEG_AVAILABLE = FFMPEG_BIN is not None
 if FFMPEG_AVAILABLE:
     print("✅ ffmpeg is available - video transcription ready!")
 else:
     print("⚠️  ffmpeg not available - video transcription will fail")
 
-# Try to import video processing libraries (optional now)
-try:
-    from moviepy.editor import VideoFileClip
-    MOVIEPY_AVAILABLE = True
-except ImportError:
-    MOVIEPY_AVAILABLE = False
-
-try:
-    from pydub import AudioSegment
-    PYDUB_AVAILABLE = True
-except ImportError:
-    PYDUB_AVAILABLE = False
+# ffmpeg's -progress output reports how much audio it has written; the key says ms
+# but the value is in microseconds
+_OUT_TIME_PATTERN = re.compile(r'^out_time_ms=(\d+)\s*$', re.MULTILINE)
 
 class VideoTranscriber:
-    def __init__(self, openai_api_key: str):
+    # Output half of every ffmpeg command, built once.
+    # Whisper works on 16 kHz mono, so anything richer is upload bytes it throws away.
+    _FFMPEG_ARGS_TAIL = (
+        '-vn',                 # no video (audio only)
+        '-acodec', 'libopus',  # audio codec
+        '-ar', '16000',        # audio rate
+        '-ac', '1',            # audio channels
+        '-ab', '16k',          # audio bitrate
+        '-f', 'ogg',           # container, since there is no file extension to infer it from
+        '-progress', 'pipe:2', # machine-readable progress on stderr, used for the duration
+        '-nostats',            # drop the human-readable progress line
+        'pipe:1'               # write to stdout
+    )
+
+    # Long audio is sent to the API as overlapping segments transcribed in parallel
+    SEGMENT_SECONDS = 30
+    SEGMENT_OVERLAP_SECONDS = 2
+
+    def __init__(self, openai_api_key: str, max_workers: int = 8,
+                 cache_path: str = "transcription/transcripts.cache"):
+        # openai pulls in httpx and pydantic, so only import it once a transcriber is needed
+        import openai
         self.client = openai.OpenAI(api_key=openai_api_key)
-        self.temp_dir = "temp_downloads"
-        os.makedirs(self.temp_dir, exist_ok=True)
+        self.max_workers = max_workers  # posts transcribed concurrently in a batch
+
+        # WHISPER_BACKEND=local runs Whisper on this machine with faster-whisper instead of the API
+        self.whisper_backend = os.getenv('WHISPER_BACKEND', 'openai')
+        if self.whisper_backend == 'local' and importlib.util.find_spec('faster_whisper') is None:
+            print("⚠️  WHISPER_BACKEND=local but faster-whisper is not installed - using the OpenAI API")
+            self.whisper_backend = 'openai'
+        self.local_model_name = os.getenv('WHISPER_MODEL', 'small')
+        self._local_model = None
+        self._local_model_lock = threading.Lock()
+
+        # Finished transcripts keyed by post_id, so re-runs don't pay Whisper again.
+        # shelve isn't thread-safe and batches run in a pool, hence the lock. The shelf is
+        # opened per access since a long-lived handle would lock out other server processes.
+        os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+        self.cache_path = cache_path
+        self._cache_lock = threading.Lock()
+
+        # One pooled session for every download so CDN connections and TLS sessions are reused
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers * 2)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        # Shared by all videos so segment uploads stay within max_workers concurrent API calls
+        self.segment_executor = ThreadPoolExecutor(max_workers=max_workers)
 
     def transcribe_video_from_url(self, video_url: str, post_id: str) -> Optional[Dict]:
         """
-        Download video, extract audio, transcribe with Whisper, then cleanup
+        Stream video through ffmpeg into memory and transcribe the audio with Whisper
         """
-        video_path = None
-        audio_path = None
+        cached = self._get_cached_transcript(post_id)
+        if cached:
+            print(f"Using cached transcript for post {post_id}")
+            return cached
 
         try:
-            # Step 1: Download video
-            print(f"Downloading video for post {post_id}...")
-            video_path = self._download_video(video_url, post_id)
-            if not video_path:
-                return None
-
-            # Step 2: Extract audio
-            print(f"Extracting audio from video {post_id}...")
-            audio_path = self._extract_audio(video_path, post_id)
-            if not audio_path:
+            # Step 1: Download and extract audio in one pass, nothing touches the disk
+            print(f"Streaming audio from video {post_id}...")
+            audio_bytes, duration = self._stream_audio(video_url, post_id)
+            if not audio_bytes:
                 return None
 
-            # Step 3: Transcribe audio
+            # Step 2: Transcribe audio
             print(f"Transcribing audio for post {post_id}...")
-            transcript_result = self._transcribe_audio(audio_path)
+            if self.whisper_backend == 'openai' and duration > 2 * self.SEGMENT_SECONDS:
+                transcript_result = self._transcribe_long_audio(audio_bytes, duration)
+            else:
+                transcript_result = self._transcribe_audio(audio_bytes)
             if not transcript_result:
                 return None
 
-            # Step 4: Get video metadata
-            duration = self._get_video_duration(video_path)
-
-            return {
+            result = {
                 "post_id": post_id,
                 "transcript": transcript_result["text"],
                 "duration": duration,
                 "language": transcript_result.get("language", "unknown"),
                 "confidence": "whisper_default"  # Whisper doesn't return confidence scores
             }
+            self._cache_transcript(post_id, result)
+            return result
 
         except Exception as e:
             print(f"Error transcribing video {post_id}: {str(e)}")
             return None
 
-        finally:
-            # Always cleanup temp files
-            self._cleanup_files([video_path, audio_path])
-
-    def _download_video(self, video_url: str, post_id: str) -> Optional[str]:
-        """Download video to temporary location"""
+    def _get_cached_transcript(self, post_id: str) -> Optional[Dict]:
+        """Look up a previously finished transcript"""
         try:
-            response = requests.get(video_url, stream=True)
-            response.raise_for_status()
-
-            video_path = os.path.join(self.temp_dir, f"{post_id}.mp4")
-
-            with open(video_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-
-            return video_path
-
+            with self._cache_lock, shelve.open(self.cache_path) as cache:
+                return cache.get(str(post_id))
         except Exception as e:
-            print(f"Error downloading video: {str(e)}")
+            print(f"Error reading transcript cache: {str(e)}")
             return None
 
-    def _extract_audio(self, video_path: str, post_id: str) -> Optional[str]:
-        """Extract audio from video file using ffmpeg"""
+    def _cache_transcript(self, post_id: str, result: Dict):
+        """Remember a finished transcript for later runs"""
+        try:
+            with self._cache_lock, shelve.open(self.cache_path) as cache:
+                cache[str(post_id)] = result
+        except Exception as e:
+            print(f"Error writing transcript cache: {str(e)}")
+
+    def _stream_audio(self, video_url: str, post_id: str) -> Tuple[Optional[bytes], int]:
+        """Extract audio from a video URL, returning the encoded audio bytes and duration"""
         if not FFMPEG_AVAILABLE:
             print(f"⚠️  Cannot extract audio from {post_id} - ffmpeg not available")
-            return None
+            return None, 0
+
+        # Feed the download into ffmpeg's stdin as it arrives
+        audio_bytes, duration = self._run_ffmpeg('pipe:0', post_id, feed_url=video_url)
+        if audio_bytes:
+            return audio_bytes, duration
+
+        # MP4s with the index at the end can't be read from a pipe; let ffmpeg seek the URL itself
+        print(f"Retrying audio extraction for {post_id} with ffmpeg reading the URL directly...")
+        return self._run_ffmpeg(video_url, post_id)
+
+    def _run_ffmpeg(self, source: str, post_id: str, feed_url: Optional[str] = None,
+                    timeout: int = 300) -> Tuple[Optional[bytes], int]:
+        """Run ffmpeg on a source, optionally feeding it a download, and collect stdout"""
+        command = (FFMPEG_BIN, '-i', source) + self._FFMPEG_ARGS_TAIL  # source is pipe:0 or the URL
 
         try:
-            audio_path = os.path.join(self.temp_dir, f"{post_id}.mp3")
-
-            # Use ffmpeg to extract audio directly
-            command = [
-                'ffmpeg',
-                '-i', video_path,      # input video file
-                '-vn',                 # no video (audio only)
-                '-acodec', 'mp3',      # audio codec
-                '-ar', '44100',        # audio rate
-                '-ac', '2',            # audio channels
-                '-ab', '192k',         # audio bitrate
-                '-y',                  # overwrite output file if exists
-                audio_path
-            ]
-
-            # Run ffmpeg command
-            result = subprocess.run(
+            proc = subprocess.Popen(
                 command,
-                capture_output=True,
-                text=True,
-                timeout=300  # 5 minute timeout
+                stdin=subprocess.PIPE if feed_url else subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE
             )
+        except Exception as e:
+            print(f"❌ Error starting ffmpeg: {str(e)}")
+            return None, 0
+
+        stderr_chunks = []
+        feed_errors = []
+        timed_out = threading.Event()
+
+        def kill():
+            timed_out.set()
+            proc.kill()
+
+        def drain_stderr():
+            # ffmpeg blocks if its stderr pipe fills up, so keep reading it
+            stderr_chunks.append(proc.stderr.read())
+
+        def feed():
+            try:
+                with self.session.get(feed_url, stream=True, timeout=60) as response:
+                    response.raise_for_status()
+                    for chunk in response.iter_content(chunk_size=65536):
+                        proc.stdin.write(chunk)
+            except BrokenPipeError:
+                pass  # ffmpeg exited early; its return code tells us why
+            except Exception as e:
+                feed_errors.append(e)
+            finally:
+                try:
+                    proc.stdin.close()
+                except OSError:
+                    pass
+
+        threads = [threading.Thread(target=drain_stderr, daemon=True)]
+        if feed_url:
+            threads.append(threading.Thread(target=feed, daemon=True))
+        for thread in threads:
+            thread.start()
+
+        timer = threading.Timer(timeout, kill)
+        timer.start()
+        try:
+            audio_bytes = proc.stdout.read()
+            proc.wait()
+        finally:
+            timer.cancel()
+            for thread in threads:
+                thread.join()
 
-            if result.returncode == 0 and os.path.exists(audio_path):
-                print(f"✅ Audio extracted successfully for {post_id}")
-                return audio_path
-            else:
-                print(f"❌ ffmpeg failed for {post_id}: {result.stderr}")
-                return None
+        stderr = b''.join(stderr_chunks).decode(errors='replace')
 
-        except subprocess.TimeoutExpired:
+        if timed_out.is_set():
             print(f"❌ Audio extraction timed out for {post_id}")
-            return None
-        except Exception as e:
-            print(f"❌ Error extracting audio: {str(e)}")
-            return None
+            return None, 0
+        if feed_errors:
+            print(f"❌ Error downloading video: {str(feed_errors[0])}")
+            return None, 0
+        if proc.returncode != 0 or not audio_bytes:
+            print(f"❌ ffmpeg failed for {post_id}: {stderr[-2000:]}")
+            return None, 0
+
+        print(f"✅ Audio extracted successfully for {post_id}")
+        return audio_bytes, self._parse_duration(stderr)
+
+    def _parse_duration(self, ffmpeg_stderr: str) -> int:
+        """Read the audio duration in seconds from the last ffmpeg progress report"""
+        out_times = _OUT_TIME_PATTERN.findall(ffmpeg_stderr)
+        if not out_times:
+            return 0
+        return int(out_times[-1]) // 1_000_000
 
-    def _transcribe_audio(self, audio_path: str) -> Optional[Dict]:
+    def _transcribe_audio(self, audio_bytes: bytes) -> Optional[Dict]:
         """Transcribe audio using OpenAI Whisper"""
+        if self.whisper_backend == 'local':
+            return self._transcribe_audio_locally(audio_bytes)
+
         try:
-            with open(audio_path, "rb") as audio_file:
-                transcript = self.client.audio.transcriptions.create(
-                    model="whisper-1",
-                    file=audio_file,
-                    response_format="verbose_json"
-                )
+            # The SDK accepts a (filename, content, mime type) tuple, so no file is needed
+            transcript = self.client.audio.transcriptions.create(
+                model="whisper-1",
+                file=("audio.ogg", audio_bytes, "audio/ogg"),
+                response_format="text"  # plain string; nothing downstream uses segments or language
+            )
 
             return {
-                "text": transcript.text,
-                "language": transcript.language if hasattr(transcript, 'language') else "unknown"
+                "text": transcript.strip(),
+                "language": "unknown"
             }
 
         except Exception as e:
             print(f"Error transcribing audio: {str(e)}")
             return None
 
-    def _get_video_duration(self, video_path: str) -> int:
-        """Get video duration in seconds using ffmpeg"""
-        if not FFMPEG_AVAILABLE:
-            return 0
+    def _transcribe_long_audio(self, audio_bytes: bytes, duration: int) -> Optional[Dict]:
+        """Transcribe long audio as overlapping segments in parallel and stitch the text together"""
+        starts = range(0, duration, self.SEGMENT_SECONDS)
+        futures = [self.segment_executor.submit(self._transcribe_segment, audio_bytes, start) for start in starts]
+        segment_results = [future.result() for future in futures]
+
+        if not all(segment_results):
+            print("Segmented transcription failed, retrying as a single upload...")
+            return self._transcribe_audio(audio_bytes)
+
+        text = segment_results[0]["text"]
+        for segment_result in segment_results[1:]:
+            text = self._merge_overlapping_text(text, segment_result["text"])
+
+        return {"text": text, "language": segment_results[0].get("language", "unknown")}
+
+    def _transcribe_segment(self, audio_bytes: bytes, start: int) -> Optional[Dict]:
+        """Cut one segment (plus overlap) out of the audio and transcribe it"""
+        length = self.SEGMENT_SECONDS + self.SEGMENT_OVERLAP_SECONDS
+        command = (
+            FFMPEG_BIN, '-i', 'pipe:0',
+            '-ss', str(start), '-t', str(length),  # output-side seek works on piped input
+            '-c', 'copy', '-f', 'ogg', 'pipe:1'
+        )
 
         try:
-            # Use ffprobe (part of ffmpeg) to get duration
-            command = [
-                'ffprobe',
-                '-v', 'quiet',
-                '-show_entries', 'format=duration',
-                '-of', 'csv=p=0',
-                video_path
-            ]
-
-            result = subprocess.run(
-                command,
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
+            result = subprocess.run(command, input=audio_bytes, capture_output=True, timeout=60)
+        except Exception as e:
+            print(f"❌ Error cutting audio segment at {start}s: {str(e)}")
+            return None
 
-            if result.returncode == 0 and result.stdout.strip():
-                duration = float(result.stdout.strip())
-                return int(duration)
-            else:
-                return 0
+        if result.returncode != 0 or not result.stdout:
+            print(f"❌ ffmpeg failed cutting segment at {start}s: {result.stderr.decode(errors='replace')[-2000:]}")
+            return None
 
-        except Exception:
-            return 0
+        return self._transcribe_audio(result.stdout)
+
+    def _merge_overlapping_text(self, text: str, next_text: str, max_overlap_words: int = 15) -> str:
+        """Join two segment transcripts, dropping words the overlap made appear in both"""
+        words = text.split()
+        next_words = next_text.split()
+
+        def normalize(word_list):
+            return [word.strip('.,!?;:"\'').lower() for word in word_list]
+
+        tail = normalize(words[-max_overlap_words:])
+        head = normalize(next_words[:max_overlap_words])
+
+        # Longest suffix of the first text that is also a prefix of the next one
+        for size in range(min(len(tail), len(head)), 0, -1):
+            if tail[-size:] == head[:size]:
+                next_words = next_words[size:]
+                break
+
+        return " ".join(words + next_words)
+
+    def _get_local_model(self):
+        """Load the faster-whisper model on first use"""
+        with self._local_model_lock:
+            if self._local_model is None:
+                # Deferred so the API backend never pays for importing CTranslate2
+                import ctranslate2
+                from faster_whisper import WhisperModel
+
+                if ctranslate2.get_cuda_device_count() > 0:
+                    device, compute_type = "cuda", "int8_float16"
+                else:
+                    device, compute_type = "cpu", "int8"
+
+                print(f"Loading local Whisper model '{self.local_model_name}' on {device}...")
+                # num_workers lets the batch threads transcribe in parallel on one model
+                self._local_model = WhisperModel(
+                    self.local_model_name,
+                    device=device,
+                    compute_type=compute_type,
+                    num_workers=min(self.max_workers, 4)
+                )
 
-    def _cleanup_files(self, file_paths: list):
-        """Clean up temporary files"""
-        for file_path in file_paths:
-            if file_path and os.path.exists(file_path):
-                try:
-                    os.remove(file_path)
-                    print(f"Cleaned up {file_path}")
-                except Exception as e:
-                    print(f"Error cleaning up {file_path}: {str(e)}")
+        return self._local_model
+
+    def _transcribe_audio_locally(self, audio_bytes: bytes) -> Optional[Dict]:
+        """Transcribe audio on this machine with faster-whisper"""
+        try:
+            segments, info = self._get_local_model().transcribe(io.BytesIO(audio_bytes), beam_size=1)
+
+            return {
+                # segments is a generator; joining it runs the actual decoding
+                "text": " ".join(segment.text.strip() for segment in segments),
+                "language": info.language
+            }
+
+        except Exception as e:
+            print(f"Error transcribing audio locally: {str(e)}")
+            return None
+
+    def stream_batch(self, video_posts: list) -> Iterator[Tuple[Dict, Optional[Dict]]]:
+        """Transcribe multiple video posts, yielding (post, result) as each one finishes"""
+        # Posts sharing a media_url (duplicates, re-posts) are transcribed once
+        by_url = {}
+        for post in video_posts:
+            by_url.setdefault(post["media_url"], []).append(post)
+
+        # Each post is download/ffmpeg/API bound, so run several at once
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self._transcribe_post, posts[0]): posts for posts in by_url.values()}
+
+            for future in as_completed(futures):
+                posts = futures[future]
+                result = future.result()
+
+                # Copy the result for each duplicate before the caller gets to modify it
+                results = [result]
+                for duplicate in posts[1:]:
+                    duplicate_result = None
+                    if result:
+                        duplicate_result = dict(result, post_id=duplicate["post_id"])
+                        self._cache_transcript(duplicate["post_id"], duplicate_result)
+                    results.append(duplicate_result)
+
+                yield from zip(posts, results)
 
     def transcribe_post_batch(self, video_posts: list) -> Dict:
         """Transcribe multiple video posts"""
@@ -207,15 +378,9 @@ class VideoTranscriber:
             "total_processed": 0
         }
 
-        for post in video_posts:
-            print(f"\nProcessing post {post['post_id']}...")
+        for post, transcript_result in self.stream_batch(video_posts):
             results["total_processed"] += 1
 
-            transcript_result = self.transcribe_video_from_url(
-                post["media_url"],
-                post["post_id"]
-            )
-
             if transcript_result:
                 # Add original post data to result
                 transcript_result.update({
@@ -236,4 +401,9 @@ class VideoTranscriber:
         print(f"- Failed: {len(results['failed'])}")
         print(f"- Total: {results['total_processed']}")
 
-        return results
\ No newline at end of file
+        return results
+
+    def _transcribe_post(self, post: Dict) -> Optional[Dict]:
+        """Transcribe a single post from a batch"""
+        print(f"\nProcessing post {post['post_id']}...")
+        return self.transcribe_video_from_url(post["media_url"], post["post_id"])
\ No newline at end of file
@@ -1,6 +1,9 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash
+from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, Response, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 import os
-import json
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from dotenv import load_dotenv
 
@@ -9,22 +12,117 @@ import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from database.models import DatabaseManager
-from scrapers.instagram_scraper import InstagramScraper
-from transcription.transcriber import VideoTranscriber
 # Removed ContentAnalyzer - using simplified RAG approach
-from knowledge_base.rag_system import RAGKnowledgeBase
 from coaches.ai_coach import CoachManager
 
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
 # Load environment variables
 load_dotenv()
 
+class ORJSONProvider(DefaultJSONProvider):
+    """JSON provider that serializes responses with orjson"""
+    # numpy scores from the knowledge base serialize natively; non-string keys are allowed like json
+    options = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS if ORJSON_AVAILABLE else 0
+
+    def dumps(self, obj, **kwargs) -> str:
+        return orjson.dumps(obj, default=self.default, option=self.options).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # orjson already produces bytes, so skip the str round trip
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=self.options),
+            mimetype=self.mimetype
+        )
+
 app = Flask(__name__)
+if ORJSON_AVAILABLE:
+    app.json = ORJSONProvider(app)
 app.secret_key = os.getenv('FLASK_SECRET_KEY', 'dev-secret-key-change-in-production')
 
 # Initialize system components
 db = DatabaseManager()
-rag_system = RAGKnowledgeBase(os.getenv('OPENAI_API_KEY'), db)
-coach_manager = CoachManager(os.getenv('OPENAI_API_KEY'), db, rag_system)
+
+# The knowledge base (FAISS, pandas, tiktoken) and transcriber are built on first use,
+# so pages that only read the database don't pay for importing them
+_rag_system = None
+_transcriber = None
+_components_lock = threading.Lock()
+
+def get_rag_system():
+    """Shared RAG knowledge base, created on first use"""
+    global _rag_system
+    with _components_lock:
+        if _rag_system is None:
+            from knowledge_base.rag_system import RAGKnowledgeBase
+            _rag_system = RAGKnowledgeBase(os.getenv('OPENAI_API_KEY'), db)
+    return _rag_system
+
+def get_transcriber():
+    """Shared video transcriber, created on first use"""
+    global _transcriber
+    with _components_lock:
+        if _transcriber is None:
+            from transcription.transcriber import VideoTranscriber
+            _transcriber = VideoTranscriber(os.getenv('OPENAI_API_KEY'))
+    return _transcriber
+
+coach_manager = CoachManager(os.getenv('OPENAI_API_KEY'), db, get_rag_system)
+
+# Long-running processing/transcription runs here so requests return immediately
+job_executor = ThreadPoolExecutor(max_workers=int(os.getenv('JOB_WORKERS', '2')))
+
+def submit_job(job_type: str, creator_id: int, func, *args):
+    """Queue func(*args) as a background job and return the 202 response for it"""
+    job_id = uuid.uuid4().hex
+    db.create_job(job_id, job_type, creator_id, os.getpid())
+    job_executor.submit(_run_job, job_id, func, *args)
+
+    return jsonify({
+        "success": True,
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": url_for('get_job_status', job_id=job_id)
+    }), 202
+
+def _run_job(job_id: str, func, *args):
+    """Run a queued job, recording its outcome in the jobs table"""
+    if not db.update_job(job_id, 'running'):
+        return  # Already failed, e.g. interrupted before it got a worker
+
+    try:
+        db.update_job(job_id, 'finished', result=func(*args))
+    except Exception as e:
+        print(f"Job {job_id} failed: {str(e)}")
+        db.update_job(job_id, 'failed', error=str(e))
+
+def _process_alive(pid) -> bool:
+    """Whether another server process with this pid is still running"""
+    if not pid or pid == os.getpid() or os.name != 'posix':
+        return False
+    try:
+        os.kill(pid, 0)  # signal 0 only checks that the process exists
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+def fail_interrupted_jobs():
+    """Mark jobs whose server process is gone as failed so pollers stop waiting"""
+    for job in db.get_unfinished_jobs():
+        if not _process_alive(job['worker_pid']):
+            db.update_job(job['id'], 'failed', error="Interrupted by server restart")
 
 @app.route('/')
 def index():
@@ -62,14 +160,14 @@ def scrape_creator():
             return jsonify({"error": "Username is required"}), 400
 
         # Initialize scraper
+        from scrapers.instagram_scraper import InstagramScraper
         scraper = InstagramScraper(os.getenv('APIFY_API_TOKEN'))
 
         # Scrape content
         scrape_result = scraper.scrape_profile(username, max_posts)
 
         # Save creator to database (handle existing creators)
-        creators = db.get_creators()
-        existing_creator = next((c for c in creators if c['username'] == username), None)
+        existing_creator = db.get_creator_by_username(username)
 
         if existing_creator:
             creator_id = existing_creator['id']
@@ -81,14 +179,8 @@ def scrape_creator():
                 bio=scrape_result['profile_data'].get('bio')
             )
 
-        # Save posts to database
-        posts_saved = 0
-        for post in scrape_result['posts']:
-            try:
-                db.add_post(creator_id, post)
-                posts_saved += 1
-            except Exception as e:
-                print(f"Error saving post {post.get('post_id')}: {e}")
+        # Save posts to database in a single transaction
+        posts_saved = db.add_posts_bulk(creator_id, scrape_result['posts'])
 
         return jsonify({
             "success": True,
@@ -109,83 +201,91 @@ def process_creator(creator_id):
 
 @app.route('/api/process/<int:creator_id>', methods=['POST'])
 def process_creator_content(creator_id):
-    """API endpoint to process creator content"""
+    """API endpoint to process creator content in the background"""
     try:
         # Get creator posts
         posts = db.get_creator_posts(creator_id)
         if not posts:
             return jsonify({"error": "No posts found for creator"}), 404
 
-        results = {
-            "creator_id": creator_id,
-            "total_posts": len(posts),
-            "transcription_results": {},
-            "analysis_results": {},
-            "coach_creation_results": {}
-        }
-
-        # Step 1: Transcribe video content
-        print("Starting transcription...")
-        transcriber = VideoTranscriber(os.getenv('OPENAI_API_KEY'))
-
-        video_posts = [post for post in posts if post['post_type'] == 'video' and post['media_url']]
-        if video_posts:
-            transcription_results = transcriber.transcribe_post_batch(video_posts)
-
-            # Update posts with transcripts
-            for result in transcription_results['success']:
-                # Update database with transcript
-                # This would need a method in DatabaseManager to update transcripts
-                pass
+        return submit_job('process', creator_id, _process_creator_posts, creator_id, posts)
 
-            results["transcription_results"] = {
-                "videos_processed": len(video_posts),
-                "successful": len(transcription_results['success']),
-                "failed": len(transcription_results['failed'])
-            }
-
-        # Step 2: Create simplified coach profile (no analysis needed)
-        print("Creating simplified coach profile...")
-
-        # Get creator info for profile
-        creators = db.get_creators()
-        creator = next((c for c in creators if c['id'] == creator_id), None)
-
-        # Create minimal coach profile - RAG system will handle the intelligence
-        coach_profile = {
-            "username": creator['username'] if creator else f"creator_{creator_id}",
-            "platform": "instagram",
-            "content_types": ["video", "image"],
-            "total_posts": len(posts),
-            "transcribed_posts": len([p for p in posts if p.get('transcript')])
-        }
-
-        # Save simplified profile
-        db.save_coach_profile(creator_id, coach_profile)
-
-        results["analysis_results"] = {
-            "profile_created": True,
-            "total_posts": coach_profile["total_posts"],
-            "transcribed_posts": coach_profile["transcribed_posts"]
-        }
-
-        # Step 3: Create knowledge base
-        print("Creating knowledge base...")
-        kb_result = rag_system.create_knowledge_base(creator_id, posts, coach_profile)
+    except Exception as e:
+        return jsonify({"error": f"Processing failed: {str(e)}"}), 500
 
-        results["coach_creation_results"] = {
-            "knowledge_chunks": kb_result.get('total_chunks', 0),
-            "coach_ready": True
+def _process_creator_posts(creator_id: int, posts: list) -> dict:
+    """Transcribe, profile and index a creator's posts; runs as a background job"""
+    results = {
+        "creator_id": creator_id,
+        "total_posts": len(posts),
+        "transcription_results": {},
+        "analysis_results": {},
+        "coach_creation_results": {}
+    }
+
+    # Step 1: Transcribe video content
+    print("Starting transcription...")
+
+    # Posts that already have a transcript don't need another Whisper run
+    video_posts = db.get_untranscribed_videos(creator_id)
+    if video_posts:
+        successful = 0
+
+        # Save each transcript as soon as it lands, while the rest are still in flight
+        for post, result in get_transcriber().stream_batch(video_posts):
+            if result and db.update_post_transcript(post['post_id'], result['transcript']):
+                successful += 1
+
+        # Reload so the profile and knowledge base below see the new transcripts
+        if successful:
+            posts = db.get_creator_posts(creator_id)
+
+        results["transcription_results"] = {
+            "videos_processed": len(video_posts),
+            "successful": successful,
+            "failed": len(video_posts) - successful
         }
 
-        return jsonify({
-            "success": True,
-            "results": results,
-            "next_step": f"/coach/{creator_id}"
-        })
-
-    except Exception as e:
-        return jsonify({"error": f"Processing failed: {str(e)}"}), 500
+    # Step 2: Create simplified coach profile (no analysis needed)
+    print("Creating simplified coach profile...")
+
+    # Get creator info for profile
+    creator = db.get_creator(creator_id)
+
+    # Create minimal coach profile - RAG system will handle the intelligence
+    coach_profile = {
+        "username": creator['username'] if creator else f"creator_{creator_id}",
+        "platform": "instagram",
+        "content_types": ["video", "image"],
+        "total_posts": len(posts),
+        "transcribed_posts": len([p for p in posts if p.get('transcript')])
+    }
+
+    # Save simplified profile
+    db.save_coach_profile(creator_id, coach_profile)
+
+    results["analysis_results"] = {
+        "profile_created": True,
+        "total_posts": coach_profile["total_posts"],
+        "transcribed_posts": coach_profile["transcribed_posts"]
+    }
+
+    # Step 3: Create knowledge base
+    print("Creating knowledge base...")
+    # Build on a separate instance so chat searches running meanwhile keep their own index
+    kb_result = get_rag_system().clone().create_knowledge_base(creator_id, posts, coach_profile)
+    coach_manager.unload_coach(creator_id)
+
+    results["coach_creation_results"] = {
+        "knowledge_chunks": kb_result.get('total_chunks', 0),
+        "coach_ready": True
+    }
+
+    return {
+        "success": True,
+        "results": results,
+        "next_step": f"/coach/{creator_id}"
+    }
 
 @app.route('/coaches')
 def coaches_list():
@@ -232,6 +332,41 @@ def ask_coach(creator_id):
     except Exception as e:
         return jsonify({"error": f"Failed to get response: {str(e)}"}), 500
 
+@app.route('/api/ask/<int:creator_id>/stream', methods=['POST'])
+def ask_coach_stream(creator_id):
+    """API endpoint to stream a coach's answer as newline-delimited JSON"""
+    try:
+        data = request.get_json() or {}
+        question = data.get('question', '').strip()
+
+        if not question:
+            return jsonify({"error": "Question is required"}), 400
+
+        stream = coach_manager.ask_coach_stream_by_id(creator_id, question)
+        if stream is None:
+            return jsonify({"error": f"Coach not available for creator {creator_id}"}), 404
+
+    except Exception as e:
+        return jsonify({"error": f"Failed to get response: {str(e)}"}), 500
+
+    def generate():
+        # One {"delta": ...} line per chunk of text, then {"done": true, "response": ...}.
+        # The final response is authoritative: if generation failed partway it holds
+        # only the apology, and the client replaces the streamed text with it
+        try:
+            while True:
+                try:
+                    delta = next(stream)
+                except StopIteration as finished:
+                    yield app.json.dumps({"done": True, "response": finished.value}) + "\n"
+                    return
+                yield app.json.dumps({"delta": delta}) + "\n"
+
+        except Exception as e:
+            yield app.json.dumps({"error": f"Failed to get response: {str(e)}"}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 @app.route('/api/coach/<int:creator_id>/info')
 def get_coach_info(creator_id):
     """Get coach information"""
@@ -259,11 +394,7 @@ def api_coaches():
 def posts_management():
     """Posts management interface"""
     try:
-        creators = db.get_creators()
-        # Add post count for each creator
-        for creator in creators:
-            posts = db.get_creator_posts(creator['id'])
-            creator['post_count'] = len(posts)
+        creators = db.get_creators_with_post_counts()
 
         return render_template('posts.html', creators=creators)
 
@@ -293,19 +424,13 @@ def get_creator_posts_api(creator_id):
 
 @app.route('/api/transcribe/<int:creator_id>', methods=['POST'])
 def transcribe_creator_videos(creator_id):
-    """API endpoint to transcribe videos for a creator"""
+    """API endpoint to transcribe videos for a creator in the background"""
     try:
         data = request.get_json() or {}
         post_ids = data.get('post_ids', [])  # If empty, transcribe all
 
-        posts = db.get_creator_posts(creator_id)
-
-        # Filter to video posts that need transcription
-        video_posts = []
-        for post in posts:
-            if post['post_type'] == 'video' and not post.get('transcript'):
-                if not post_ids or post['post_id'] in post_ids:
-                    video_posts.append(post)
+        # Video posts that need transcription
+        video_posts = db.get_untranscribed_videos(creator_id, post_ids)
 
         if not video_posts:
             return jsonify({
@@ -314,28 +439,37 @@ def transcribe_creator_videos(creator_id):
                 "transcribed": 0
             })
 
-        # Initialize transcriber
-        transcriber = VideoTranscriber(os.getenv('OPENAI_API_KEY'))
+        return submit_job('transcribe', creator_id, _transcribe_videos, video_posts)
 
-        # Transcribe videos
-        results = transcriber.transcribe_post_batch(video_posts)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        # Update database with transcripts
-        transcribed_count = 0
-        for result in results['success']:
-            # Update the post with transcript
-            if db.update_post_transcript(result['post_id'], result['transcript']):
-                transcribed_count += 1
+def _transcribe_videos(video_posts: list) -> dict:
+    """Transcribe video posts and save the transcripts; runs as a background job"""
+    # Transcribe videos, writing each transcript while the rest are still in flight
+    transcribed_count = 0
+    failed_count = 0
+    for post, result in get_transcriber().stream_batch(video_posts):
+        if result and db.update_post_transcript(post['post_id'], result['transcript']):
+            transcribed_count += 1
+        else:
+            failed_count += 1
 
-        return jsonify({
-            "success": True,
-            "transcribed": transcribed_count,
-            "failed": len(results['failed']),
-            "total_processed": len(video_posts)
-        })
+    return {
+        "success": True,
+        "transcribed": transcribed_count,
+        "failed": failed_count,
+        "total_processed": len(video_posts)
+    }
 
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+@app.route('/api/jobs/<job_id>')
+def get_job_status(job_id):
+    """API endpoint to poll a background job"""
+    job = db.get_job(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+
+    return jsonify(job)
 
 @app.route('/api/update-coach/<int:creator_id>', methods=['POST'])
 def update_coach_knowledge(creator_id):
@@ -351,8 +485,7 @@ def update_coach_knowledge(creator_id):
             return jsonify({"error": "No real posts found"}), 400
 
         # Get creator info
-        creators = db.get_creators()
-        creator = next((c for c in creators if c['id'] == creator_id), None)
+        creator = db.get_creator(creator_id)
         if not creator:
             return jsonify({"error": "Creator not found"}), 404
 
@@ -369,7 +502,8 @@ def update_coach_knowledge(creator_id):
         db.save_coach_profile(creator_id, coach_profile)
 
         # Rebuild knowledge base
-        kb_result = rag_system.create_knowledge_base(creator_id, real_posts, coach_profile)
+        kb_result = get_rag_system().clone().create_knowledge_base(creator_id, real_posts, coach_profile)
+        coach_manager.unload_coach(creator_id)
 
         return jsonify({
             "success": True,
@@ -417,15 +551,9 @@ def bulk_delete_posts():
                 "message": "No post IDs provided"
             }), 400
 
-        deleted_count = 0
-        failed_posts = []
-
-        for post_id in post_ids:
-            success = db.delete_post(post_id)
-            if success:
-                deleted_count += 1
-            else:
-                failed_posts.append(post_id)
+        deleted = set(db.delete_posts(post_ids))
+        deleted_count = len(deleted)
+        failed_posts = [post_id for post_id in post_ids if str(post_id) not in deleted]
 
         return jsonify({
             "success": True,
@@ -449,9 +577,12 @@ def not_found(error):
 def internal_error(error):
     return render_template('500.html'), 500
 
-if __name__ == '__main__':
-    # Create database tables on startup
-    db.init_database()
+def create_app():
+    """Prepare the app for serving; used by wsgi.py and the dev server"""
+    # Tables were already created when DatabaseManager was constructed at import
+    fail_interrupted_jobs()
+    return app
 
-    # Run in debug mode for development
-    app.run(debug=True, host='0.0.0.0', port=5001)
\ No newline at end of file
+if __name__ == '__main__':
+    # Development server only; production runs under gunicorn via wsgi.py
+    create_app().run(debug=os.getenv('FLASK_DEBUG') == '1', host='0.0.0.0', port=5001)
\ No newline at end of file
@@ -0,0 +1,7 @@
+"""
+WSGI entry point: gunicorn -k gthread -w 2 --threads 8 -b 0.0.0.0:5001 --timeout 600 wsgi:app
+"""
+
+from web_ui.app import create_app
+
+app = create_app()